@@ -65,5 +65,12 @@ fi
 
 cat /code/brewerylog.txt
 
+# No worker of the previous run is alive, so images it left processing are queued again
+python manage.py process-images --restarted --retry-failed --requeue-only
+
+# Drain the queue in the background, also picking up images whose worker was lost later on,
+# e.g. when gunicorn times out or recycles a worker before it ran
+python manage.py process-images --watch 60 &
+
 # Start gunicorn
 gunicorn main.wsgi:application --bind [::]:8000 --timeout 120 --workers 2
\ No newline at end of file
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
 from django.conf import settings
+from django.db.models.signals import post_migrate, pre_migrate
 
 class BreweriesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'breweries'
\ No newline at end of file
+    name = 'breweries'
+
+    def ready(self):
+        from breweries import signals
+        pre_migrate.connect(signals.create_trigram_extension, sender=self)
+        post_migrate.connect(signals.backfill_search_vectors, sender=self)
+        post_migrate.connect(signals.backfill_points, sender=self)
@@ -0,0 +1,58 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from breweries.utils import image_processing
+
+
+class Command(BaseCommand):
+    help = 'Transcodes brewery images that are waiting in the processing queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-failed', action='store_true',
+            help=f'Also retry failed images that have had fewer than {image_processing.MAX_ATTEMPTS} attempts',
+        )
+        parser.add_argument(
+            '--restarted', action='store_true',
+            help='Requeue every image left processing, for use before the server starts when no worker is alive',
+        )
+        parser.add_argument(
+            '--requeue-only', action='store_true',
+            help='Requeue images without processing them',
+        )
+        parser.add_argument(
+            '--watch', type=int, metavar='SECONDS',
+            help='Keep draining the queue every SECONDS, picking up images whose worker was lost',
+        )
+
+    def handle(self, *args, **options):
+        self.watching = bool(options['watch'])
+        stale_after = timedelta(0) if options['restarted'] else image_processing.STALE_AFTER
+        self.requeue(retry_failed=options['retry_failed'], stale_after=stale_after)
+        if options['requeue_only']:
+            return
+
+        self.drain()
+        while options['watch']:
+            time.sleep(options['watch'])
+            # The database may have restarted in between
+            close_old_connections()
+            self.requeue()
+            self.drain()
+
+    def requeue(self, retry_failed=False, stale_after=image_processing.STALE_AFTER):
+        requeued = image_processing.requeue(retry_failed=retry_failed, stale_after=stale_after)
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} images')
+
+    def drain(self):
+        expired = image_processing.remove_expired_uploads()
+        if expired:
+            self.stdout.write(f'Removed {expired} expired uploads')
+
+        processed = 0
+        while image_processing.process_next():
+            processed += 1
+        if processed or not self.watching:
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} images'))
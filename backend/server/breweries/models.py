@@ -1,14 +1,29 @@
 from collections.abc import Collection
+import math
 import os
+from datetime import timedelta
+import re
+import tempfile
 from typing import Iterable
 import uuid
-from django.db import models
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, DateField, DateTimeField, DecimalField, Exists, F, FloatField, Func, IntegerField, OuterRef, Prefetch, Q, Subquery, TextField, Value
+from django.db.models.functions import Cast, Coalesce, Concat, Greatest, Lower, TruncDate
+from django.utils import timezone
 from django.utils.deconstruct import deconstructible
 
 from django.contrib.auth import get_user_model
+from django.contrib.gis.db import models as gis_models
+from django.contrib.gis.db.models import Collect
+from django.contrib.gis.db.models.functions import Centroid, Distance, SnapToGrid
+from django.contrib.gis.geos import Point
+from django.contrib.postgres.expressions import ArraySubquery
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorField, TrigramWordSimilarity
 from django.forms import ValidationError
-from django_resized import ResizedImageField
 
 ADVENTURE_TYPES = [
     ('general', 'General 🌍'),
@@ -46,11 +61,60 @@ TRANSPORTATION_TYPES = [
     ('other', 'Other')
 ]
 
+# Text search configuration used for the brewery search vector. 'simple' does not stem,
+# which suits brewery names and places and keeps prefix matching predictable.
+SEARCH_CONFIG = 'simple'
+
+# Weight of each searchable field in the search vector, also used to restrict a search to one field
+SEARCH_WEIGHTS = {
+    'name': 'A',
+    'location': 'B',
+    'activity_types': 'C',
+    'description': 'D',
+}
+
+# WGS 84, the reference system of the latitude and longitude columns
+POINT_SRID = 4326
+# How many index candidates BreweryQuerySet.nearest ranks per requested brewery
+NEAREST_CANDIDATES_FACTOR = 4
+# Bounds the widening of the candidates near the poles, cos(87°)
+NEAREST_MIN_COS = 0.05
+
 # Assuming you have a default user ID you want to use
 default_user_id = 1  # Replace with an actual user ID
 
 User = get_user_model()
 
+class OwnedQuerySet(models.QuerySet):
+    def for_serialization(self):
+        """
+        Serialization plan for flat serializers built on CustomModelSerializer, which only
+        need the owner's uuid. Annotating it avoids one user lookup per serialized row.
+        """
+        return self.annotate(user_uuid=F('user_id__uuid'))
+
+def _column_aggregate(queryset, expression, function, output_field):
+    """
+    An aggregate of a correlated queryset as a subquery. The function is not a Django
+    aggregate, so it spans the whole filtered queryset without a GROUP BY.
+    """
+    return Subquery(
+        queryset.order_by().annotate(value=Func(expression, function=function)).values('value'),
+        output_field=output_field,
+    )
+
+def _latest_update(queryset):
+    """
+    The newest updated_at of a correlated queryset as a subquery.
+    """
+    return _column_aggregate(queryset, F('updated_at'), 'MAX', DateTimeField())
+
+def _row_count(queryset):
+    """
+    The number of rows of a correlated queryset as a subquery.
+    """
+    return _column_aggregate(queryset, F('pk'), 'COUNT', IntegerField())
+
 class Visit(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
     brewery = models.ForeignKey('Brewery', on_delete=models.CASCADE, related_name='visits')
@@ -67,6 +131,142 @@ class Visit(models.Model):
     def __str__(self):
         return f"{self.brewery.name} - {self.start_date} to {self.end_date}"
 
+class KNNDistance(Func):
+    """
+    The PostGIS `<->` distance operator, which an ORDER BY can answer with a GiST index scan.
+    """
+    arg_joiner = ' <-> '
+    template = '%(expressions)s'
+    output_field = FloatField()
+
+class BreweryQuerySet(OwnedQuerySet):
+    def with_is_visited(self):
+        """
+        Annotates each brewery with `is_visited`, true when it has at least one visit
+        that started on or before today. Computed in SQL so it can be filtered and
+        read by the serializer without loading the visits.
+        """
+        today = timezone.now().date()
+        return self.annotate(
+            is_visited=Exists(
+                Visit.objects.filter(brewery=OuterRef('pk'), start_date__lte=today)
+            )
+        )
+
+    def update_search_vector(self):
+        """
+        Recomputes the stored search vector of every brewery in the queryset in a single UPDATE.
+        """
+        activity_types = Func(F('activity_types'), Value(' '), function='array_to_string', output_field=TextField())
+        return self.update(search_vector=(
+            SearchVector('name', weight=SEARCH_WEIGHTS['name'], config=SEARCH_CONFIG) +
+            SearchVector('location', weight=SEARCH_WEIGHTS['location'], config=SEARCH_CONFIG) +
+            SearchVector(activity_types, weight=SEARCH_WEIGHTS['activity_types'], config=SEARCH_CONFIG) +
+            SearchVector('description', weight=SEARCH_WEIGHTS['description'], config=SEARCH_CONFIG)
+        ))
+
+    def update_point(self):
+        """
+        Rebuilds the point of every brewery in the queryset from its latitude and longitude
+        in a single UPDATE. Breweries without both coordinates get no point.
+        """
+        return self.update(point=Func(
+            Func(F('longitude'), F('latitude'), function='ST_MakePoint'),
+            Value(POINT_SRID),
+            function='ST_SetSRID',
+            output_field=gis_models.PointField(srid=POINT_SRID),
+        ))
+
+    def clusters(self, cell_size):
+        """
+        Groups the breweries that have a point into square grid cells of `cell_size` degrees,
+        giving the centroid and the number of breweries of every non-empty cell.
+        """
+        return self.filter(point__isnull=False).annotate(
+            cell=SnapToGrid('point', cell_size)
+        ).values('cell').annotate(
+            center=Centroid(Collect('point')), count=Count('pk')
+        ).values_list('center', 'count').order_by()
+
+    def nearest(self, center, limit):
+        """
+        Returns a list of the `limit` breweries closest to the `center` point, nearest first, each
+        annotated with its `distance`. Candidates come from a KNN index scan, which measures in
+        planar degrees, so a few extra are fetched and ranked again by their distance on the sphere.
+
+        A degree of longitude shrinks with 1/cos(latitude) while the scan counts it in full, so the
+        candidate set grows by that factor away from the equator. It stays a heuristic: close to
+        the poles and across the antimeridian, a brewery can still be missed for a farther one.
+        """
+        widening = 1 / max(math.cos(math.radians(center.y)), NEAREST_MIN_COS)
+        candidates = self.filter(point__isnull=False).annotate(
+            knn_distance=KNNDistance(F('point'), Value(center, output_field=gis_models.PointField(srid=POINT_SRID))),
+            distance=Distance('point', center),
+        ).order_by('knn_distance')[:math.ceil(limit * NEAREST_CANDIDATES_FACTOR * widening)]
+        return sorted(candidates, key=lambda brewery: brewery.distance.m)[:limit]
+
+    def search(self, query, property='all'):
+        """
+        Full-text search over the indexed search vector, ranked by relevance. Every word of the
+        query is matched as a prefix, and `property` restricts the match to one field's weight.
+        """
+        weight = SEARCH_WEIGHTS.get(property, '')
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return self.none()
+        search_query = SearchQuery(
+            ' & '.join(f'{term}:*{weight}' for term in terms), search_type='raw', config=SEARCH_CONFIG
+        )
+        # ts_rank returns a real, which a cursor could not hold exactly. As a double precision
+        # value the rank round-trips through the cursor, so keyset pages neither repeat nor skip rows
+        return self.filter(search_vector=search_query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+        ).order_by('-rank', '-updated_at')
+
+    def autocomplete(self, query, limit=10):
+        """
+        Typo-tolerant name and location suggestions using trigram word similarity,
+        which is answered by the trigram GIN indexes on both columns.
+        """
+        return self.filter(
+            Q(name__trigram_word_similar=query) | Q(location__trigram_word_similar=query)
+        ).annotate(
+            similarity=Greatest(TrigramWordSimilarity(query, 'name'), TrigramWordSimilarity(query, 'location'))
+        ).order_by('-similarity', 'name').values('id', 'name', 'location', 'similarity')[:limit]
+
+    def validators(self):
+        """
+        Everything a serialized brewery depends on, read in one query without loading the
+        nested objects: the newest updated_at and number of its visits and images, its category
+        and the is_visited flag, which changes as planned visits start. Used for conditional requests.
+        """
+        visits = Visit.objects.filter(brewery=OuterRef('pk'))
+        images = BreweryImage.objects.filter(brewery=OuterRef('pk'))
+        category_breweries = Brewery.objects.filter(category=OuterRef('category'), user_id=OuterRef('category__user_id'))
+        return self.with_is_visited().annotate(
+            visits_updated_at=_latest_update(visits),
+            visits_count=_row_count(visits),
+            images_updated_at=_latest_update(images),
+            images_count=_row_count(images),
+            category_updated_at=F('category__updated_at'),
+            category_breweries=_row_count(category_breweries),
+        ).values(
+            'pk', 'updated_at', 'is_visited', 'visits_updated_at', 'visits_count', 'images_updated_at',
+            'images_count', 'category_id', 'category_updated_at', 'category_breweries',
+        )
+
+    def for_serialization(self):
+        """
+        Serialization plan for BrewerySerializer: annotates everything it reads and
+        prefetches the nested images, visits and category, so serializing a page of
+        breweries costs a fixed number of queries regardless of the page size.
+        """
+        return super().for_serialization().with_is_visited().prefetch_related(
+            Prefetch('images', queryset=BreweryImage.objects.for_serialization()),
+            'visits',
+            Prefetch('category', queryset=Category.objects.with_num_breweries()),
+        )
+
 class Brewery(models.Model):
     #id = models.AutoField(primary_key=True)
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
@@ -87,6 +287,24 @@ class Brewery(models.Model):
     collection = models.ForeignKey('Collection', on_delete=models.CASCADE, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by breweries.signals, see BreweryQuerySet.update_search_vector
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+    # Kept in sync with latitude and longitude by save(), spatially indexed for the map filters
+    point = gis_models.PointField(srid=POINT_SRID, null=True, blank=True, editable=False)
+
+    objects = BreweryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='brewery_search_vector_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='brewery_name_trgm_idx'),
+            GinIndex(fields=['location'], opclasses=['gin_trgm_ops'], name='brewery_location_trgm_idx'),
+            # Keyset pagination orders by these with the primary key as a tiebreaker
+            models.Index(fields=['user_id', '-updated_at', '-id'], name='brewery_user_updated_idx'),
+            # Shared breweries are filtered by the ids of the collections shared with the user
+            models.Index(fields=['collection', '-updated_at'], name='brewery_coll_updated_idx'),
+            models.Index(F('user_id'), Lower('name'), F('id'), name='brewery_user_lower_name_idx'),
+        ]
 
     # DEPRECATED FIELDS - TO BE REMOVED IN FUTURE VERSIONS
     # Migrations performed in this version will remove these fields
@@ -122,12 +340,102 @@ class Brewery(models.Model):
             }
         )
             self.category = category
+
+        if self.latitude is not None and self.longitude is not None:
+            self.point = Point(float(self.longitude), float(self.latitude), srid=POINT_SRID)
+        else:
+            self.point = None
+        if update_fields is not None and {'latitude', 'longitude'}.intersection(update_fields):
+            update_fields = {*update_fields, 'point'}
             
         return super().save(force_insert, force_update, using, update_fields)
 
     def __str__(self):
         return self.name
 
+# Kinds of the entries of Collection.itinerary
+ITINERARY_VISIT = 'visit'
+ITINERARY_TRANSPORTATION = 'transportation'
+ITINERARY_NOTE = 'note'
+ITINERARY_CHECKLIST = 'checklist'
+
+# The type of the latitude and longitude columns, for aggregates over them
+COORDINATE_FIELD = DecimalField(max_digits=9, decimal_places=6)
+
+class CollectionQuerySet(OwnedQuerySet):
+    def validators(self):
+        """
+        Everything a serialized collection depends on, read in one query of correlated subqueries
+        (joins would multiply the rows of the nested sets): the newest updated_at and the number of
+        each nested set, how many of its breweries are visited and how many breweries each of its
+        categories has. Used for conditional requests.
+        """
+        breweries = Brewery.objects.filter(collection=OuterRef('pk'))
+        nested = {
+            'breweries': breweries,
+            'visits': Visit.objects.filter(brewery__collection=OuterRef('pk')),
+            'images': BreweryImage.objects.filter(brewery__collection=OuterRef('pk')),
+            'categories': Category.objects.filter(brewery__collection=OuterRef('pk')),
+            'transportations': Transportation.objects.filter(collection=OuterRef('pk')),
+            'notes': Note.objects.filter(collection=OuterRef('pk')),
+            'checklists': Checklist.objects.filter(collection=OuterRef('pk')),
+            'checklist_items': ChecklistItem.objects.filter(checklist__collection=OuterRef('pk')),
+        }
+        annotations = {}
+        for name, queryset in nested.items():
+            annotations[f'{name}_updated_at'] = _latest_update(queryset)
+            annotations[f'{name}_count'] = _row_count(queryset)
+        annotations['visited_count'] = _row_count(breweries.with_is_visited().filter(is_visited=True))
+        # The nested categories serialize num_breweries, which also counts breweries outside the
+        # collection, so the count of every category in it is part of the validators
+        category_breweries = Brewery.objects.filter(
+            category__in=Brewery.objects.filter(collection=OuterRef(OuterRef('pk'))).values('category'),
+            user_id=F('category__user_id'),
+        ).order_by().values('category').annotate(
+            entry=Concat(Cast('category', TextField()), Value(':'), Cast(Count('pk'), TextField()), output_field=TextField())
+        ).order_by('category').values('entry')
+        annotations['category_breweries'] = ArraySubquery(category_breweries)
+        annotations['shared_count'] = _row_count(Collection.shared_with.through.objects.filter(collection=OuterRef('pk')))
+        return self.annotate(**annotations).values('pk', 'updated_at', *annotations)
+
+    def for_summary(self):
+        """
+        Serialization plan for CollectionSummarySerializer: the counts, visit date range, cover
+        image and bounding box of each collection as correlated subqueries, so drawing a page of
+        collection cards loads no breweries, transportations, notes or checklists.
+        """
+        breweries = Brewery.objects.filter(collection=OuterRef('pk'))
+        located = breweries.filter(latitude__isnull=False, longitude__isnull=False)
+        visits = Visit.objects.filter(brewery__collection=OuterRef('pk'))
+        cover = BreweryImage.objects.filter(brewery__collection=OuterRef('pk')).exclude(image='').order_by('-is_primary', 'brewery__created_at')
+        return super().for_serialization().annotate(
+            brewery_count=_row_count(breweries),
+            visited_count=_row_count(breweries.with_is_visited().filter(is_visited=True)),
+            transportation_count=_row_count(Transportation.objects.filter(collection=OuterRef('pk'))),
+            note_count=_row_count(Note.objects.filter(collection=OuterRef('pk'))),
+            checklist_count=_row_count(Checklist.objects.filter(collection=OuterRef('pk'))),
+            first_visit=_column_aggregate(visits, F('start_date'), 'MIN', DateField()),
+            last_visit=_column_aggregate(visits, Coalesce('end_date', 'start_date'), 'MAX', DateField()),
+            cover_image=Subquery(cover.values('image')[:1]),
+            min_longitude=_column_aggregate(located, F('longitude'), 'MIN', COORDINATE_FIELD),
+            min_latitude=_column_aggregate(located, F('latitude'), 'MIN', COORDINATE_FIELD),
+            max_longitude=_column_aggregate(located, F('longitude'), 'MAX', COORDINATE_FIELD),
+            max_latitude=_column_aggregate(located, F('latitude'), 'MAX', COORDINATE_FIELD),
+        ).prefetch_related('shared_with')
+
+    def for_serialization(self):
+        """
+        Serialization plan for CollectionSerializer, which nests breweries, transportations,
+        notes and checklists. Each nested set is prefetched once for the whole page.
+        """
+        return super().for_serialization().prefetch_related(
+            Prefetch('brewery_set', queryset=Brewery.objects.for_serialization()),
+            Prefetch('transportation_set', queryset=Transportation.objects.for_serialization()),
+            Prefetch('note_set', queryset=Note.objects.for_serialization()),
+            Prefetch('checklist_set', queryset=Checklist.objects.for_serialization()),
+            'shared_with',
+        )
+
 class Collection(models.Model):
     #id = models.AutoField(primary_key=True)
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
@@ -144,6 +452,14 @@ class Collection(models.Model):
     shared_with = models.ManyToManyField(User, related_name='shared_with', blank=True)
     link = models.URLField(blank=True, null=True, max_length=2083)
 
+    objects = CollectionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination orders by these with the primary key as a tiebreaker
+            models.Index(fields=['user_id', '-updated_at', '-id'], name='collection_user_updated_idx'),
+            models.Index(F('user_id'), Lower('name'), F('id'), name='collection_user_lower_name_idx'),
+        ]
 
     # if connected breweries are private and collection is public, raise an error
     def clean(self):
@@ -152,6 +468,38 @@ class Collection(models.Model):
                 if not brewery.is_public:
                     raise ValidationError('Public collections cannot be associated with private breweries. Collection: ' + self.name + ' Brewery: ' + brewery.name)
 
+    def itinerary(self):
+        """
+        The dated contents of the collection as one UNION ALL of (kind, id, date, time, brewery_id)
+        rows: visits to its breweries, transportations, notes and checklists. Ordering and slicing
+        it happens in the database, so a page of the timeline reads only the rows it shows.
+        Undated notes and checklists sort last.
+        """
+        no_time = Value(None, output_field=DateTimeField())
+        no_brewery = Value(None, output_field=models.UUIDField())
+
+        def entries(queryset, kind, date, time=no_time, brewery=no_brewery):
+            return queryset.order_by().annotate(
+                entry_kind=Value(kind, output_field=models.CharField()),
+                entry_date=date,
+                entry_time=time,
+                entry_brewery=brewery,
+            ).values_list('entry_kind', 'pk', 'entry_date', 'entry_time', 'entry_brewery')
+
+        visits = entries(
+            Visit.objects.filter(brewery__collection=self, start_date__isnull=False),
+            ITINERARY_VISIT, F('start_date'), brewery=F('brewery_id'),
+        )
+        transportations = entries(
+            Transportation.objects.filter(collection=self, date__isnull=False),
+            ITINERARY_TRANSPORTATION, TruncDate('date'), time=F('date'),
+        )
+        notes = entries(Note.objects.filter(collection=self), ITINERARY_NOTE, F('date'))
+        checklists = entries(Checklist.objects.filter(collection=self), ITINERARY_CHECKLIST, F('date'))
+        return visits.union(transportations, notes, checklists, all=True).order_by(
+            'entry_date', 'entry_time', 'entry_kind', 'id'
+        )
+
     def __str__(self):
         return self.name
     
@@ -179,6 +527,15 @@ class Transportation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The user's own and shared rows, newest first, see breweries.utils.visibility
+            models.Index(fields=['user_id', '-updated_at'], name='transport_user_updated_idx'),
+            models.Index(fields=['collection', '-updated_at'], name='transport_coll_updated_idx'),
+        ]
+
     def clean(self):
         print(self.date)
         if self.date and self.end_date and self.date > self.end_date:
@@ -207,6 +564,15 @@ class Note(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The user's own and shared rows, newest first, see breweries.utils.visibility
+            models.Index(fields=['user_id', '-updated_at'], name='note_user_updated_idx'),
+            models.Index(fields=['collection', '-updated_at'], name='note_coll_updated_idx'),
+        ]
+
     def clean(self):
         if self.collection:
             if self.collection.is_public and not self.is_public:
@@ -217,6 +583,15 @@ class Note(models.Model):
     def __str__(self):
         return self.name
     
+class ChecklistQuerySet(OwnedQuerySet):
+    def for_serialization(self):
+        """
+        Serialization plan for ChecklistSerializer, prefetching the nested items.
+        """
+        return super().for_serialization().prefetch_related(
+            Prefetch('checklistitem_set', queryset=ChecklistItem.objects.for_serialization())
+        )
+
 class Checklist(models.Model):
     # id = models.AutoField(primary_key=True)
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
@@ -229,6 +604,15 @@ class Checklist(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ChecklistQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The user's own and shared rows, newest first, see breweries.utils.visibility
+            models.Index(fields=['user_id', '-updated_at'], name='checklist_user_updated_idx'),
+            models.Index(fields=['collection', '-updated_at'], name='checklist_coll_updated_idx'),
+        ]
+
     def clean(self):
         if self.collection:
             if self.collection.is_public and not self.is_public:
@@ -250,6 +634,8 @@ class ChecklistItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OwnedQuerySet.as_manager()
+
     def clean(self):
         if self.checklist.is_public and not self.checklist.is_public:
             raise ValidationError('Checklist items associated with a public checklist must be public. Checklist: ' + self.checklist.name + ' Checklist item: ' + self.name)
@@ -270,20 +656,170 @@ class PathAndRename:
         filename = f"{uuid.uuid4()}.{ext}"
         return os.path.join(self.path, filename)
 
+# Processing states of a BreweryImage. Uploads are stored as they are and transcoded to WEBP
+# in the background, see breweries.utils.image_processing
+IMAGE_PENDING = 'pending'
+IMAGE_PROCESSING = 'processing'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+IMAGE_STATUSES = [
+    (IMAGE_PENDING, 'Pending'),
+    (IMAGE_PROCESSING, 'Processing'),
+    (IMAGE_READY, 'Ready'),
+    (IMAGE_FAILED, 'Failed'),
+]
+
+class ImageBlob(models.Model):
+    """
+    A transcoded image stored once under the SHA-256 of the upload it was made from, shared by
+    every BreweryImage of the same content. Uploads of known content are attached to the blob
+    without being stored or transcoded again. Blobs count their references and are deleted with
+    their files when the last image goes. Their names never change content, so they are served
+    as immutable.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.ImageField(upload_to='blobs/')
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def file_name(sha256):
+        return f'blobs/{sha256[:2]}/{sha256}.webp'
+
+    @classmethod
+    def acquire(cls, sha256):
+        """
+        Adds a reference to the blob of the content and returns it, or None if it is not stored.
+        """
+        if not cls.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1):
+            return None
+        return cls.objects.get(pk=sha256)
+
+    @classmethod
+    def store(cls, sha256, content):
+        """
+        Stores new content with one reference. Another worker may have stored the same content
+        in the meantime, then that blob gets the reference.
+        """
+        name = cls.file_name(sha256)
+        path = default_storage.path(name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written next to its fixed name and renamed into place. Saving through the storage
+            # would give a concurrent store of the same content a suffixed name no row points to
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as partial:
+                for chunk in content.chunks():
+                    partial.write(chunk)
+            os.replace(partial.name, path)
+        try:
+            with transaction.atomic():
+                return cls.objects.create(sha256=sha256, file=name, ref_count=1)
+        except IntegrityError:
+            return cls.acquire(sha256)
+
+    @classmethod
+    def release(cls, sha256):
+        """
+        Drops a reference, deleting the blob when it was the last. The files go once the
+        transaction commits, unless the content was stored again by then.
+        """
+        cls.objects.filter(pk=sha256).update(ref_count=F('ref_count') - 1)
+        if cls.objects.filter(pk=sha256, ref_count__lte=0).delete()[0]:
+            transaction.on_commit(lambda: cls.delete_files(sha256))
+
+    @classmethod
+    def delete_files(cls, sha256):
+        if cls.objects.filter(pk=sha256).exists():
+            return
+        from breweries.utils.image_sizes import IMAGE_SIZES, derived_name
+        name = cls.file_name(sha256)
+        for file_name in [name, *(derived_name(name, size) for size in IMAGE_SIZES)]:
+            default_storage.delete(file_name)
+
+    def __str__(self):
+        return self.sha256
+
 class BreweryImage(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
     user_id = models.ForeignKey(
         User, on_delete=models.CASCADE, default=default_user_id)
-    image = ResizedImageField(
-        force_format="WEBP",
-        quality=75,
+    # The transcoded WEBP, empty until processing is done
+    image = models.ImageField(
+        blank=True,
         upload_to=PathAndRename('images/')  # Use the callable class here
     )
+    # The upload as received, removed once it has been transcoded
+    original = models.FileField(upload_to=PathAndRename('originals/'), null=True, blank=True, editable=False)
+    # SHA-256 of the upload and the blob holding its transcoded image, which image then names.
+    # Images stored before blobs existed have neither
+    content_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    blob = models.ForeignKey(ImageBlob, related_name='images', on_delete=models.PROTECT, null=True, blank=True, editable=False)
+    status = models.CharField(max_length=16, choices=IMAGE_STATUSES, default=IMAGE_READY)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
     brewery = models.ForeignKey(Brewery, related_name='images', on_delete=models.CASCADE)
     is_primary = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The processing queue, only the few images that are not ready are indexed
+            models.Index(fields=['status', 'updated_at'], name='breweryimage_queue_idx', condition=~Q(status=IMAGE_READY)),
+        ]
+
+    def __str__(self):
+        return (self.image or self.original).name
+
+class ImageUpload(models.Model):
+    """
+    A brewery image uploaded in parts, see ImageUploadViewSet. The parts are appended to a
+    staging file as they arrive and received counts the bytes on disk, which is the offset the
+    next part has to start at. The finished file becomes a BreweryImage.
+    """
+    # The request body limit of nginx.conf, which single uploads were already subject to
+    MAX_SIZE = 100 * 1024 * 1024
+    # Unfinished uploads are removed by process-images after this long without a part
+    EXPIRES_AFTER = timedelta(days=1)
+    # A part being received blocks other parts for at most this long, more than the gunicorn
+    # timeout after which the worker receiving it is gone
+    PART_TIMEOUT = timedelta(minutes=5)
+
+    id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
+    user_id = models.ForeignKey(User, on_delete=models.CASCADE)
+    brewery = models.ForeignKey(Brewery, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    # Set while a part is written to the staging file, so parts are received one at a time
+    receiving_since = models.DateTimeField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def path(self):
+        return os.path.join(settings.UPLOAD_STAGING_ROOT, f'{self.id}.part')
+
+    def is_receiving(self):
+        return self.receiving_since is not None and self.receiving_since > timezone.now() - self.PART_TIMEOUT
+
+    def delete_file(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
 
     def __str__(self):
-        return self.image.url
+        return self.filename
+
+class CategoryQuerySet(models.QuerySet):
+    def with_num_breweries(self):
+        """
+        Annotates each category with the number of its owner's breweries using it,
+        read by CategorySerializer instead of counting per category.
+        """
+        return self.annotate(
+            num_breweries=Count('brewery', filter=Q(brewery__user_id=F('user_id')))
+        )
 
 class Category(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
@@ -292,6 +828,9 @@ class Category(models.Model):
     name = models.CharField(max_length=200)
     display_name = models.CharField(max_length=200)
     icon = models.CharField(max_length=200, default='🌍')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CategoryQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'Categories'
@@ -304,4 +843,65 @@ class Category(models.Model):
     
     
     def __str__(self):
-        return self.name + ' - ' + self.display_name + ' - ' + self.icon
\ No newline at end of file
+        return self.name + ' - ' + self.display_name + ' - ' + self.icon
+
+class UserStats(models.Model):
+    """
+    Per-user counters for the stats endpoint, adjusted incrementally by breweries.signals as
+    breweries, collections and visited places are created and deleted, so reading them is a
+    single primary key lookup. A missing row is built by counting, see for_user().
+    """
+    user_id = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    brewery_count = models.IntegerField(default=0)
+    trips_count = models.IntegerField(default=0)
+    visited_city_count = models.IntegerField(default=0)
+    visited_region_count = models.IntegerField(default=0)
+    visited_country_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'User Stats'
+
+    @classmethod
+    def for_user(cls, user_id):
+        stats = cls.objects.filter(pk=user_id).first()
+        if stats is None:
+            stats = cls.recount(user_id)
+        return stats
+
+    @classmethod
+    def recount(cls, user_id):
+        from worldtravel.models import VisitedCity, VisitedRegion
+        # The row is created before counting, so writes committing from now on are incremented
+        # on it. Writes in progress hold the row lock taken by their increment, so the counts
+        # below are read once they commit, and later increments wait until the counts are set
+        cls.objects.get_or_create(user_id_id=user_id)
+        with transaction.atomic():
+            stats = cls.objects.select_for_update().get(pk=user_id)
+            visited_regions = VisitedRegion.objects.filter(user_id=user_id)
+            stats.brewery_count = Brewery.objects.filter(user_id=user_id).count()
+            stats.trips_count = Collection.objects.filter(user_id=user_id).count()
+            stats.visited_city_count = VisitedCity.objects.filter(user_id=user_id).count()
+            stats.visited_region_count = visited_regions.count()
+            stats.visited_country_count = visited_regions.values('region__country').distinct().count()
+            stats.save()
+        return stats
+
+    @classmethod
+    def increment(cls, user_id, **deltas):
+        """
+        Adjusts counters in place with F() expressions, so concurrent changes are not lost.
+        Users without a row yet are skipped; their row is counted from scratch when first read.
+        """
+        updated = cls.objects.filter(pk=user_id).update(
+            updated_at=timezone.now(), **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        if not updated:
+            # A first read may count before this write commits and create the row after this
+            # increment was skipped, so the row is counted again once the write is visible
+            transaction.on_commit(lambda: cls.recount_existing(user_id))
+
+    @classmethod
+    def recount_existing(cls, user_id):
+        if cls.objects.filter(pk=user_id).exists():
+            cls.recount(user_id)
@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from breweries.utils.membership import is_shared_with
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -31,26 +32,22 @@ class IsPublicReadOnly(permissions.BasePermission):
     
 class CollectionShared(permissions.BasePermission):
     """
-    Custom permission to only allow read-only access to public objects,
-    and write access to the owner of the object.
+    Custom permission to allow:
+    - Full access for owners and for users the collection is shared with
+    - Read-only access for others to public collections
     """
 
     def has_object_permission(self, request, view, obj):
-
-        # Read permissions are allowed if the object is shared with the user
-        if obj.shared_with and obj.shared_with.filter(id=request.user.id).exists():
-            return True
-        
-        # Write permissions are allowed if the object is shared with the user
-        if request.method not in permissions.SAFE_METHODS and obj.shared_with.filter(id=request.user.id).exists():
+        # Owner first, it needs no query
+        if obj.user_id_id == request.user.id:
             return True
 
         # Read permissions are allowed if the object is public
-        if request.method in permissions.SAFE_METHODS:
-            return obj.is_public or obj.user_id == request.user
+        if request.method in permissions.SAFE_METHODS and obj.is_public:
+            return True
 
-        # Write permissions are only allowed to the owner of the object
-        return obj.user_id == request.user
+        # Read and write permissions are allowed if the object is shared with the user
+        return is_shared_with(request, obj.pk)
 
 class IsOwnerOrSharedWithFullAccess(permissions.BasePermission):
     """
@@ -61,19 +58,14 @@ class IsOwnerOrSharedWithFullAccess(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        
-        # Allow GET only for a public object
-        if request.method in permissions.SAFE_METHODS and obj.is_public:
+
+        # Allow all actions for the owner
+        if obj.user_id_id == request.user.id:
             return True
-        # Check if the object has a collection
-        if hasattr(obj, 'collection') and obj.collection:
-            # Allow all actions for shared users
-            if request.user in obj.collection.shared_with.all():
-                return True
 
         # Always allow GET, HEAD, or OPTIONS requests (safe methods)
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Allow all actions for the owner
-        return obj.user_id == request.user
\ No newline at end of file
+        # Allow all actions for users the object's collection is shared with
+        return is_shared_with(request, getattr(obj, 'collection_id', None))
@@ -1,26 +1,42 @@
 from django.utils import timezone
-import os
-from .models import Brewery, BreweryImage, ChecklistItem, Collection, Note, Transportation, Checklist, Visit, Category
+from .models import Brewery, BreweryImage, ChecklistItem, Collection, ImageUpload, Note, Transportation, Checklist, Visit, Category
 from rest_framework import serializers
-from main.utils import CustomModelSerializer
+from main.utils import CustomModelSerializer, media_url
+from breweries.utils import image_sizes
 
 
 class BreweryImageSerializer(CustomModelSerializer):
     class Meta:
         model = BreweryImage
-        fields = ['id', 'image', 'brewery', 'is_primary']
-        read_only_fields = ['id']
+        fields = ['id', 'image', 'brewery', 'is_primary', 'status']
+        read_only_fields = ['id', 'status']
+        extra_kwargs = {'image': {'required': True}}
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
+        representation['sizes'] = representation['srcset'] = None
         if instance.image:
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            #print(public_url)
-            # remove any  ' from the url
-            public_url = public_url.replace("'", "")
-            representation['image'] = f"{public_url}/media/{instance.image.name}"
+            representation['image'] = media_url(instance.image.name)
+            representation['sizes'] = image_sizes.size_urls(instance.image.name)
+            representation['srcset'] = image_sizes.srcset(representation['sizes'])
+        elif instance.original:
+            # Until it is transcoded the upload itself is shown
+            representation['image'] = media_url(instance.original.name)
         return representation
     
+class ImageUploadSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
+
+    class Meta:
+        model = ImageUpload
+        fields = ['id', 'brewery', 'filename', 'size', 'offset', 'created_at']
+        read_only_fields = ['id', 'offset', 'created_at']
+
+    def validate_size(self, value):
+        if not 0 < value <= ImageUpload.MAX_SIZE:
+            raise serializers.ValidationError(f'Uploads must be between 1 byte and {ImageUpload.MAX_SIZE} bytes.')
+        return value
+
 class CategorySerializer(serializers.ModelSerializer):
     num_breweries = serializers.SerializerMethodField()
     class Meta:
@@ -45,6 +61,8 @@ class CategorySerializer(serializers.ModelSerializer):
         return instance
     
     def get_num_breweries(self, obj):
+        if hasattr(obj, 'num_breweries'):
+            return obj.num_breweries
         return Brewery.objects.filter(category=obj, user_id=obj.user_id).count()
     
 class VisitSerializer(serializers.ModelSerializer):
@@ -107,6 +125,9 @@ class BrewerySerializer(CustomModelSerializer):
         return category
 
     def get_is_visited(self, obj):
+        # Querysets built with Brewery.objects.with_is_visited() already carry the answer
+        if hasattr(obj, 'is_visited'):
+            return obj.is_visited
         current_date = timezone.now().date()
         for visit in obj.visits.all():
             if visit.start_date and visit.end_date and (visit.start_date <= current_date):
@@ -276,4 +297,49 @@ class CollectionSerializer(CustomModelSerializer):
             shared_uuids.append(str(user.uuid))
         representation['shared_with'] = shared_uuids
         return representation
-    
\ No newline at end of file
+    
+
+class CollectionSummarySerializer(CustomModelSerializer):
+    """
+    A collection card for list views, read from the annotations of CollectionQuerySet.for_summary
+    instead of the nested breweries, transportations, notes and checklists. Those are available
+    page by page from the collection's sub-resource actions.
+    """
+    brewery_count = serializers.IntegerField(read_only=True)
+    visited_count = serializers.IntegerField(read_only=True)
+    transportation_count = serializers.IntegerField(read_only=True)
+    note_count = serializers.IntegerField(read_only=True)
+    checklist_count = serializers.IntegerField(read_only=True)
+    first_visit = serializers.DateField(read_only=True)
+    last_visit = serializers.DateField(read_only=True)
+    cover_image = serializers.SerializerMethodField()
+    cover_image_sizes = serializers.SerializerMethodField()
+    bbox = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Collection
+        fields = [
+            'id', 'description', 'user_id', 'name', 'is_public', 'created_at', 'start_date', 'end_date',
+            'updated_at', 'is_archived', 'shared_with', 'link', 'brewery_count', 'visited_count',
+            'transportation_count', 'note_count', 'checklist_count', 'first_visit', 'last_visit',
+            'cover_image', 'cover_image_sizes', 'bbox'
+        ]
+        read_only_fields = fields
+
+    def get_cover_image(self, obj):
+        return media_url(obj.cover_image) if obj.cover_image else None
+
+    def get_cover_image_sizes(self, obj):
+        # Cards should use the card size rather than the full image
+        return image_sizes.size_urls(obj.cover_image) if obj.cover_image else None
+
+    def get_bbox(self, obj):
+        # [min longitude, min latitude, max longitude, max latitude], the order ?in_bbox takes
+        if obj.min_longitude is None:
+            return None
+        return [float(value) for value in (obj.min_longitude, obj.min_latitude, obj.max_longitude, obj.max_latitude)]
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation['shared_with'] = [str(user.uuid) for user in instance.shared_with.all()]
+        return representation
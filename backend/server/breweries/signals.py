@@ -0,0 +1,205 @@
+from django.db import connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from breweries.models import Brewery, BreweryImage, Category, Checklist, ChecklistItem, Collection, ImageBlob, ImageUpload, Note, Transportation, UserStats, Visit
+from breweries.utils.cache import PUBLIC, invalidate
+from breweries.utils.membership import SharedWith, forget_memberships
+from worldtravel.models import Region, VisitedCity, VisitedRegion
+
+# Fields that feed the brewery search vector
+SEARCH_VECTOR_FIELDS = {'name', 'location', 'activity_types', 'description'}
+
+@receiver(post_save, sender=Brewery)
+def update_brewery_search_vector(sender, instance, update_fields=None, **kwargs):
+    """
+    Keeps the stored search vector in sync with the searchable fields of a saved brewery.
+    """
+    if update_fields is not None and not SEARCH_VECTOR_FIELDS.intersection(update_fields):
+        return
+    Brewery.objects.filter(pk=instance.pk).update_search_vector()
+
+def backfill_search_vectors(sender, **kwargs):
+    """
+    Fills in the search vector of breweries that were created before it existed.
+    Connected to post_migrate so a fresh column is populated on the next migrate.
+    """
+    Brewery.objects.filter(search_vector__isnull=True).update_search_vector()
+
+def backfill_points(sender, **kwargs):
+    """
+    Fills in the point of breweries that have coordinates but were saved before the
+    point column existed. Connected to post_migrate like the search vector backfill.
+    """
+    Brewery.objects.filter(
+        point__isnull=True, latitude__isnull=False, longitude__isnull=False
+    ).update_point()
+
+def create_trigram_extension(sender, using, **kwargs):
+    """
+    The trigram indexes on brewery names and locations need pg_trgm, which has to exist
+    before the generated migrations create them. Connected to pre_migrate.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+@receiver(post_delete, sender=BreweryImage)
+def release_image_files(sender, instance, **kwargs):
+    # Blobs are shared between images and counted, an original belongs to its image alone
+    if instance.blob_id:
+        ImageBlob.release(instance.blob_id)
+    if instance.original:
+        instance.original.delete(save=False)
+
+@receiver(post_delete, sender=ImageUpload)
+def remove_staging_file(sender, instance, **kwargs):
+    # Also for uploads deleted with their brewery. After the commit, so a rollback keeps the parts
+    transaction.on_commit(instance.delete_file)
+
+# Cached responses and map tiles are keyed by a per-user data version (and a public one for
+# public breweries), so every change to data a user can see bumps that user's version. Objects
+# in a collection are also seen by the users the collection is shared with.
+
+def collection_user_ids(collection_id):
+    """
+    The owner of a collection and the users it is shared with.
+    """
+    if collection_id is None:
+        return set()
+    owner_ids = Collection.objects.filter(pk=collection_id).values_list('user_id', flat=True)
+    shared_ids = SharedWith.objects.filter(collection_id=collection_id).values_list('customuser_id', flat=True)
+    return {*owner_ids, *shared_ids}
+
+def owner_audience(owner_id, collection_id):
+    return {owner_id, *collection_user_ids(collection_id)}
+
+def public_scope(*is_public):
+    # PUBLIC is shared by every user, so it is only bumped for changes to data others can see
+    return PUBLIC if any(is_public) else None
+
+@receiver(pre_save, sender=Brewery)
+@receiver(pre_save, sender=Collection)
+def remember_public(sender, instance, **kwargs):
+    # Whether the stored row is public, so that making it private invalidates PUBLIC too
+    instance._was_public = sender.objects.filter(pk=instance.pk).values_list('is_public', flat=True).first() or False
+
+@receiver([post_save, post_delete], sender=Brewery)
+def invalidate_brewery(sender, instance, **kwargs):
+    # Collections cascade their visibility to their breweries with queryset updates, which send
+    # no signals, but the collection's own save and the collection view cover them
+    public = public_scope(instance.is_public, getattr(instance, '_was_public', False))
+    invalidate(*owner_audience(instance.user_id_id, instance.collection_id), public)
+
+@receiver([post_save, post_delete], sender=Transportation)
+@receiver([post_save, post_delete], sender=Note)
+@receiver([post_save, post_delete], sender=Checklist)
+def invalidate_collection_item(sender, instance, **kwargs):
+    invalidate(*owner_audience(instance.user_id_id, instance.collection_id))
+
+@receiver([post_save, post_delete], sender=Visit)
+@receiver([post_save, post_delete], sender=BreweryImage)
+def invalidate_brewery_detail(sender, instance, **kwargs):
+    brewery = Brewery.objects.filter(pk=instance.brewery_id).values('user_id', 'collection_id', 'is_public').first()
+    if brewery is not None:
+        invalidate(*owner_audience(brewery['user_id'], brewery['collection_id']), public_scope(brewery['is_public']))
+
+@receiver([post_save, post_delete], sender=ChecklistItem)
+def invalidate_checklist_item(sender, instance, **kwargs):
+    checklist = Checklist.objects.filter(pk=instance.checklist_id).values('user_id', 'collection_id').first()
+    if checklist is not None:
+        invalidate(*owner_audience(checklist['user_id'], checklist['collection_id']))
+
+@receiver(post_save, sender=Collection)
+@receiver(pre_delete, sender=Collection)
+def invalidate_collection(sender, instance, **kwargs):
+    # pre_delete, because the shared users are gone once the collection is deleted
+    public = public_scope(instance.is_public, getattr(instance, '_was_public', False))
+    invalidate(*owner_audience(instance.user_id_id, instance.pk), public)
+
+@receiver(m2m_changed, sender=SharedWith)
+def invalidate_collection_sharing(sender, instance, action, reverse, pk_set, **kwargs):
+    # The pre_ actions still see the users that are about to be removed or cleared
+    if action not in ('pre_add', 'pre_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance is a user and pk_set holds collection ids
+        collection_ids = pk_set or set(instance.shared_with.values_list('id', flat=True))
+        user_ids = {instance.pk}
+        for collection_id in collection_ids:
+            user_ids |= collection_user_ids(collection_id)
+    else:
+        user_ids = owner_audience(instance.user_id_id, instance.pk) | (pk_set or set())
+    invalidate(*user_ids)
+
+@receiver(m2m_changed, sender=SharedWith)
+def forget_collection_memberships(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('pre_add', 'pre_remove', 'pre_clear'):
+        return
+    if reverse:
+        collection_ids = pk_set if pk_set is not None else instance.shared_with.values_list('id', flat=True)
+        forget_memberships((collection_id, instance.pk) for collection_id in collection_ids)
+    else:
+        user_ids = pk_set if pk_set is not None else instance.shared_with.values_list('id', flat=True)
+        forget_memberships((instance.pk, user_id) for user_id in user_ids)
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    # Categories are nested in the owner's breweries, which shared collections show to other users,
+    # and public breweries show their icon to everyone. pre_delete, because the breweries are
+    # detached from the category before post_delete
+    shared_ids = SharedWith.objects.filter(collection__user_id=instance.user_id_id).values_list('customuser_id', flat=True)
+    public = public_scope(Brewery.objects.filter(category=instance, is_public=True).exists())
+    invalidate(instance.user_id_id, *shared_ids, public)
+
+@receiver([post_save, post_delete], sender=VisitedRegion)
+@receiver([post_save, post_delete], sender=VisitedCity)
+def invalidate_visited_place(sender, instance, **kwargs):
+    invalidate(instance.user_id_id)
+
+# Incremental maintenance of UserStats
+
+@receiver(post_save, sender=Brewery)
+def count_created_brewery(sender, instance, created, **kwargs):
+    if created:
+        UserStats.increment(instance.user_id_id, brewery_count=1)
+
+@receiver(post_delete, sender=Brewery)
+def count_deleted_brewery(sender, instance, **kwargs):
+    UserStats.increment(instance.user_id_id, brewery_count=-1)
+
+@receiver(post_save, sender=Collection)
+def count_created_collection(sender, instance, created, **kwargs):
+    if created:
+        UserStats.increment(instance.user_id_id, trips_count=1)
+
+@receiver(post_delete, sender=Collection)
+def count_deleted_collection(sender, instance, **kwargs):
+    UserStats.increment(instance.user_id_id, trips_count=-1)
+
+@receiver(post_save, sender=VisitedCity)
+def count_created_visited_city(sender, instance, created, **kwargs):
+    if created:
+        UserStats.increment(instance.user_id_id, visited_city_count=1)
+
+@receiver(post_delete, sender=VisitedCity)
+def count_deleted_visited_city(sender, instance, **kwargs):
+    UserStats.increment(instance.user_id_id, visited_city_count=-1)
+
+def other_visited_regions_in_country(instance):
+    country_id = Region.objects.filter(pk=instance.region_id).values_list('country_id', flat=True).first()
+    return VisitedRegion.objects.filter(
+        user_id=instance.user_id_id, region__country_id=country_id
+    ).exclude(pk=instance.pk).exists()
+
+@receiver(post_save, sender=VisitedRegion)
+def count_created_visited_region(sender, instance, created, **kwargs):
+    if created:
+        # A country is counted once, when its first region is visited
+        new_country = 0 if other_visited_regions_in_country(instance) else 1
+        UserStats.increment(instance.user_id_id, visited_region_count=1, visited_country_count=new_country)
+
+@receiver(post_delete, sender=VisitedRegion)
+def count_deleted_visited_region(sender, instance, **kwargs):
+    # ...and uncounted when its last visited region is removed
+    last_in_country = 0 if other_visited_regions_in_country(instance) else 1
+    UserStats.increment(instance.user_id_id, visited_region_count=-1, visited_country_count=-last_in_country)
@@ -1,3 +1,693 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+from datetime import timedelta
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+from users.models import CustomUser
+from worldtravel.models import Country, Region, VisitedRegion
+from .models import Brewery, BreweryImage, Category, Collection, ImageBlob, ImageUpload, Note, UserStats, Visit
+from .utils import image_processing, image_sizes
+from .utils.cache import PUBLIC, get_data_version
 
-# Create your tests here.
+class BreweryAPITestCase(APITestCase):
+    """
+    Signs up a user for each test, the feature test cases below build on it.
+    """
+
+    def setUp(self):
+        # Signup a new user
+        response = self.client.post('/_allauth/browser/v1/auth/signup', {
+            'username': 'testuser',
+            'email': 'testuser@example.com',
+            'password': 'testpassword',
+            'first_name': 'Test',
+            'last_name': 'User',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user = CustomUser.objects.get(username='testuser')
+
+    def create_breweries(self):
+        today = timezone.now().date()
+        visited = Brewery.objects.create(user_id=self.user, name='Visited')
+        Visit.objects.create(brewery=visited, start_date=today - timedelta(days=2), end_date=today - timedelta(days=1))
+        planned = Brewery.objects.create(user_id=self.user, name='Planned')
+        Visit.objects.create(brewery=planned, start_date=today + timedelta(days=7))
+        Brewery.objects.create(user_id=self.user, name='Never')
+
+class TemporaryMediaMixin:
+    """
+    Stores media and upload staging files in a temporary directory removed after each test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overridden = override_settings(MEDIA_ROOT=media_root.name, UPLOAD_STAGING_ROOT=os.path.join(media_root.name, '.uploads'))
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+class BreweryListTests(BreweryAPITestCase):
+
+    def test_filtered_is_visited(self):
+        self.create_breweries()
+
+        response = self.client.get('/api/breweries/filtered/?types=all&is_visited=true', format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['name'], 'Visited')
+        self.assertEqual(data['results'][0]['is_visited'], True)
+
+        response = self.client.get('/api/breweries/filtered/?types=all&is_visited=false&order_by=name', format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([brewery['name'] for brewery in data['results']], ['Never', 'Planned'])
+        self.assertTrue(all(not brewery['is_visited'] for brewery in data['results']))
+
+    def test_serialization_query_count_is_fixed(self):
+        category = Category.objects.create(user_id=self.user, name='taproom', display_name='Taproom')
+
+        def add_collection(size):
+            collection = Collection.objects.create(user_id=self.user, name='Trip')
+            for number in range(size):
+                brewery = Brewery.objects.create(user_id=self.user, name=f'Brewery {number}', category=category, collection=collection)
+                Visit.objects.create(brewery=brewery, start_date=timezone.now().date())
+                Note.objects.create(user_id=self.user, name=f'Note {number}', collection=collection)
+
+        add_collection(2)
+        counts = {}
+        for url in ['/api/breweries/', '/api/collections/']:
+            # Warms process-wide caches, such as content types, out of the count
+            self.client.get(url, format='json')
+            Note.objects.create(user_id=self.user, name='Invalidates cached responses')
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url, format='json')
+            counts[url] = len(queries)
+
+        # Five times the rows, the same queries
+        add_collection(8)
+        for url, count in counts.items():
+            with self.assertNumQueries(count):
+                response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(len(collection['breweries']) for collection in response.json()['results']), [2, 8])
+
+    def test_cursor_pagination(self):
+        for name in ['Charlie', 'alpha', 'Bravo']:
+            Brewery.objects.create(user_id=self.user, name=name)
+
+        response = self.client.get('/api/breweries/?pagination=cursor&page_size=2&order_by=name', format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertNotIn('count', data)
+        self.assertEqual([brewery['name'] for brewery in data['results']], ['alpha', 'Bravo'])
+        self.assertIsNone(data['previous'])
+
+        response = self.client.get(data['next'], format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([brewery['name'] for brewery in data['results']], ['Charlie'])
+        self.assertIsNone(data['next'])
+
+        response = self.client.get(data['previous'], format='json')
+        self.assertEqual([brewery['name'] for brewery in response.json()['results']], ['alpha', 'Bravo'])
+
+    def test_all_paginated_and_streamed(self):
+        self.create_breweries()
+
+        response = self.client.get('/api/breweries/all/?order_by=name', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([brewery['name'] for brewery in response.json()], ['Never', 'Planned', 'Visited'])
+
+        response = self.client.get('/api/breweries/all/?order_by=name&page_size=2', format='json')
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([brewery['name'] for brewery in data['results']], ['Never', 'Planned'])
+
+        response = self.client.get('/api/breweries/all/?order_by=name&stream=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([brewery['name'] for brewery in data], ['Never', 'Planned', 'Visited'])
+        self.assertEqual(data[2]['is_visited'], True)
+
+class BrewerySearchTests(BreweryAPITestCase):
+
+    def test_search_ranking(self):
+        Brewery.objects.create(user_id=self.user, name='Mountain Tap', description='Known for hoppy ales')
+        Brewery.objects.create(user_id=self.user, name='Hoppy Trails Brewing', location='Denver')
+
+        response = self.client.get('/api/breweries/search/?query=hop', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([brewery['name'] for brewery in response.json()], ['Hoppy Trails Brewing', 'Mountain Tap'])
+
+        response = self.client.get('/api/breweries/search/?query=hop&property=name', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([brewery['name'] for brewery in response.json()], ['Hoppy Trails Brewing'])
+
+        response = self.client.get('/api/breweries/search/?query=hop&page=1', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_search_cursor_pagination(self):
+        for number in range(3):
+            Brewery.objects.create(user_id=self.user, name=f'Hoppy Brewing {number}')
+            Brewery.objects.create(user_id=self.user, name=f'Tap {number}', description='Hoppy ales')
+
+        response = self.client.get('/api/breweries/search/?query=hop', format='json')
+        ranked = [brewery['name'] for brewery in response.json()]
+
+        names = []
+        url = '/api/breweries/search/?query=hop&pagination=cursor&page_size=2'
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            names += [brewery['name'] for brewery in data['results']]
+            # Repeated rows would otherwise page forever
+            self.assertLessEqual(len(names), 6)
+            url = data['next']
+        self.assertEqual(names, ranked)
+        self.assertEqual(len(set(names)), 6)
+
+    def test_autocomplete(self):
+        Brewery.objects.create(user_id=self.user, name='Hoppy Trails Brewing', location='Denver')
+        Brewery.objects.create(user_id=self.user, name='Mountain Tap')
+
+        def suggestions(query):
+            response = self.client.get(f'/api/breweries/autocomplete/?query={query}', format='json')
+            self.assertEqual(response.status_code, 200)
+            return [suggestion['name'] for suggestion in response.json()]
+
+        self.assertEqual(suggestions('hop'), ['Hoppy Trails Brewing'])
+        # A typo in the location
+        self.assertEqual(suggestions('denvr'), ['Hoppy Trails Brewing'])
+        self.assertEqual(suggestions('mountain'), ['Mountain Tap'])
+
+        # Cached suggestions are keyed by data version, so a new brewery shows up right away
+        Brewery.objects.create(user_id=self.user, name='Mountain View')
+        self.assertEqual(suggestions('mountain'), ['Mountain Tap', 'Mountain View'])
+
+        response = self.client.get('/api/breweries/autocomplete/?query=m', format='json')
+        self.assertEqual(response.status_code, 400)
+
+class MapTests(BreweryAPITestCase):
+
+    def test_pins(self):
+        brewery = Brewery.objects.create(user_id=self.user, name='Pinned', latitude=40.5, longitude=-105.25)
+        Brewery.objects.create(user_id=self.user, name='Nowhere')
+
+        response = self.client.get('/api/breweries/pins/', format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['fields'], ['id', 'latitude', 'longitude', 'icon', 'is_visited', 'name'])
+        self.assertEqual(data['rows'], [[str(brewery.id), 40.5, -105.25, '🌍', False, 'Pinned']])
+        etag = response['ETag']
+
+        response = self.client.get('/api/breweries/pins/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        brewery.name = 'Renamed'
+        brewery.save()
+        response = self.client.get('/api/breweries/pins/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_location_filters(self):
+        Brewery.objects.create(user_id=self.user, name='Denver', latitude=39.7392, longitude=-104.9903)
+        Brewery.objects.create(user_id=self.user, name='Boulder', latitude=40.0150, longitude=-105.2705)
+        Brewery.objects.create(user_id=self.user, name='Tokyo', latitude=35.6762, longitude=139.6503)
+        Brewery.objects.create(user_id=self.user, name='Nowhere')
+
+        response = self.client.get('/api/breweries/all/?order_by=name&in_bbox=-106,39,-104,41', format='json')
+        self.assertEqual([brewery['name'] for brewery in response.json()], ['Boulder', 'Denver'])
+
+        # Crossing the antimeridian
+        response = self.client.get('/api/breweries/all/?in_bbox=130,30,-170,40', format='json')
+        self.assertEqual([brewery['name'] for brewery in response.json()], ['Tokyo'])
+
+        response = self.client.get('/api/breweries/all/?near=39.7392,-104.9903&radius=10000', format='json')
+        self.assertEqual([brewery['name'] for brewery in response.json()], ['Denver'])
+
+        response = self.client.get('/api/breweries/all/?order_by=name&near=39.7392,-104.9903&radius=50000', format='json')
+        self.assertEqual([brewery['name'] for brewery in response.json()], ['Boulder', 'Denver'])
+
+        response = self.client.get('/api/breweries/all/?in_bbox=1,2,3', format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+    def test_vector_tiles(self):
+        brewery = Brewery.objects.create(user_id=self.user, name='Denver', latitude=39.7392, longitude=-104.9903)
+
+        response = self.client.get('/api/tiles/0/0/0.mvt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn(b'breweries', response.content)
+        etag = response['ETag']
+
+        response = self.client.get('/api/tiles/0/0/0.mvt', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        brewery.name = 'Golden'
+        brewery.save()
+        response = self.client.get('/api/tiles/0/0/0.mvt', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Golden', response.content)
+
+        response = self.client.get('/api/tiles/1/2/0.mvt')
+        self.assertEqual(response.status_code, 400)
+
+    def test_vector_tiles_change_with_the_day(self):
+        brewery = Brewery.objects.create(user_id=self.user, name='Denver', latitude=39.7392, longitude=-104.9903)
+        Visit.objects.create(brewery=brewery, start_date=timezone.now().date() + timedelta(days=1))
+
+        response = self.client.get('/api/tiles/0/0/0.mvt')
+        etag = response['ETag']
+
+        # The planned visit starts tomorrow, so the cached tile and its ETag are not reused
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch('breweries.views.tile_view.timezone.now', return_value=tomorrow):
+            response = self.client.get('/api/tiles/0/0/0.mvt', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_clustered_pins(self):
+        Brewery.objects.create(user_id=self.user, name='Denver', latitude=39.7392, longitude=-104.9903)
+        Brewery.objects.create(user_id=self.user, name='Boulder', latitude=40.0150, longitude=-105.2705)
+        Brewery.objects.create(user_id=self.user, name='Tokyo', latitude=35.6762, longitude=139.6503)
+
+        response = self.client.get('/api/breweries/pins/?cluster=true&zoom=3', format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['fields'], ['latitude', 'longitude', 'count'])
+        self.assertEqual([row[2] for row in data['rows']], [2, 1])
+
+        response = self.client.get('/api/breweries/pins/?cluster=true&zoom=12', format='json')
+        self.assertEqual([row[2] for row in response.json()['rows']], [1, 1, 1])
+
+        response = self.client.get('/api/breweries/pins/?cluster=true&zoom=3&in_bbox=100,20,160,50', format='json')
+        self.assertEqual([row[2] for row in response.json()['rows']], [1])
+
+        response = self.client.get('/api/breweries/pins/?cluster=true', format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_nearest(self):
+        Brewery.objects.create(user_id=self.user, name='Denver', latitude=39.7392, longitude=-104.9903)
+        Brewery.objects.create(user_id=self.user, name='Boulder', latitude=40.0150, longitude=-105.2705)
+        Brewery.objects.create(user_id=self.user, name='Tokyo', latitude=35.6762, longitude=139.6503)
+        Brewery.objects.create(user_id=self.user, name='Nowhere')
+
+        response = self.client.get('/api/breweries/nearest/?lat=39.75&lon=-105.0&limit=2', format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([brewery['name'] for brewery in data], ['Denver', 'Boulder'])
+        self.assertLess(data[0]['distance'], data[1]['distance'])
+        self.assertAlmostEqual(data[0]['distance'], 1450, delta=100)
+
+        response = self.client.get('/api/breweries/nearest/?lat=95&lon=0', format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_nearest_at_high_latitude(self):
+        # A degree of longitude is about 38 km at 70° north, a degree of latitude 111 km
+        Brewery.objects.create(user_id=self.user, name='East', latitude=70, longitude=21.2)
+        for offset in [0.5, 0.6, 0.7, 0.8]:
+            Brewery.objects.create(user_id=self.user, name=f'North {offset}', latitude=70 + offset, longitude=20)
+
+        response = self.client.get('/api/breweries/nearest/?lat=70&lon=20&limit=1', format='json')
+        self.assertEqual([brewery['name'] for brewery in response.json()], ['East'])
+
+class ConditionalRequestTests(BreweryAPITestCase):
+
+    def test_conditional_detail(self):
+        self.create_breweries()
+        brewery = Brewery.objects.get(name='Planned')
+
+        response = self.client.get(f'/api/breweries/{brewery.id}/', format='json')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(f'/api/breweries/{brewery.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        brewery.visits.all().delete()
+        response = self.client.get(f'/api/breweries/{brewery.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['visits'], [])
+
+        collection = Collection.objects.create(user_id=self.user, name='Trip')
+        note = Note.objects.create(user_id=self.user, name='Packing', collection=collection)
+        response = self.client.get(f'/api/collections/{collection.id}/', format='json')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(f'/api/collections/{collection.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        note.delete()
+        response = self.client.get(f'/api/collections/{collection.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['notes'], [])
+
+    def test_collection_category_counts(self):
+        category = Category.objects.create(user_id=self.user, name='taproom', display_name='Taproom')
+        collection = Collection.objects.create(user_id=self.user, name='Trip')
+        Brewery.objects.create(user_id=self.user, name='Denver', collection=collection, category=category)
+        response = self.client.get(f'/api/collections/{collection.id}/', format='json')
+        etag = response['ETag']
+
+        # A brewery outside the collection changes the num_breweries of its nested category
+        Brewery.objects.create(user_id=self.user, name='Boulder', category=category)
+        response = self.client.get(f'/api/collections/{collection.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['breweries'][0]['category']['num_breweries'], 2)
+
+    def test_cached_lists_are_invalidated(self):
+        self.create_breweries()
+
+        response = self.client.get('/api/breweries/all/?order_by=name', format='json')
+        self.assertEqual([brewery['name'] for brewery in response.json()], ['Never', 'Planned', 'Visited'])
+
+        brewery = Brewery.objects.get(name='Never')
+        Visit.objects.create(brewery=brewery, start_date=timezone.now().date())
+        response = self.client.get('/api/breweries/all/?order_by=name', format='json')
+        self.assertTrue(response.json()[0]['is_visited'])
+
+        response = self.client.get('/api/stats/counts/', format='json')
+        self.assertEqual(response.json()['brewery_count'], 3)
+        brewery.delete()
+        response = self.client.get('/api/stats/counts/', format='json')
+        self.assertEqual(response.json()['brewery_count'], 2)
+
+        # Collections shared with another user are invalidated for that user too
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='testpassword')
+        collection = Collection.objects.create(user_id=other, name='Road trip')
+        collection.shared_with.add(self.user)
+        response = self.client.get('/api/collections/shared/', format='json')
+        self.assertEqual([collection['name'] for collection in response.json()], ['Road trip'])
+
+        collection.name = 'Renamed trip'
+        collection.save()
+        response = self.client.get('/api/collections/shared/', format='json')
+        self.assertEqual([collection['name'] for collection in response.json()], ['Renamed trip'])
+
+        collection.shared_with.remove(self.user)
+        response = self.client.get('/api/collections/shared/', format='json')
+        self.assertEqual(response.json(), [])
+
+    def test_private_writes_keep_public_caches(self):
+        public_version = get_data_version(PUBLIC)
+        category = Category.objects.create(user_id=self.user, name='taproom', display_name='Taproom')
+        collection = Collection.objects.create(user_id=self.user, name='Trip')
+        brewery = Brewery.objects.create(user_id=self.user, name='Private', category=category, collection=collection)
+        Visit.objects.create(brewery=brewery, start_date=timezone.now().date())
+        category.delete()
+        self.assertEqual(get_data_version(PUBLIC), public_version)
+
+        brewery.is_public = True
+        brewery.save()
+        self.assertNotEqual(get_data_version(PUBLIC), public_version)
+
+        # Making it private again removes it from public results too
+        public_version = get_data_version(PUBLIC)
+        brewery.is_public = False
+        brewery.save()
+        self.assertNotEqual(get_data_version(PUBLIC), public_version)
+
+class UserStatsTests(BreweryAPITestCase):
+
+    def test_incremental_user_stats(self):
+        country = Country.objects.create(name='United States', country_code='US')
+        colorado = Region.objects.create(id='US-CO', name='Colorado', country=country)
+        utah = Region.objects.create(id='US-UT', name='Utah', country=country)
+
+        response = self.client.get('/api/stats/counts/', format='json')
+        self.assertEqual(response.json()['visited_country_count'], 0)
+
+        first = VisitedRegion.objects.create(user_id=self.user, region=colorado)
+        VisitedRegion.objects.create(user_id=self.user, region=utah)
+        Collection.objects.create(user_id=self.user, name='Trip')
+        stats = UserStats.objects.get(pk=self.user.id)
+        self.assertEqual((stats.visited_region_count, stats.visited_country_count, stats.trips_count), (2, 1, 1))
+
+        first.delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.visited_region_count, stats.visited_country_count), (1, 1))
+
+        response = self.client.get('/api/stats/counts/', format='json')
+        self.assertEqual(response.json()['visited_region_count'], 1)
+        self.assertEqual(response.json()['trips_count'], 1)
+
+    def test_write_during_first_stats_request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # The increment finds no row yet...
+            Brewery.objects.create(user_id=self.user, name='Denver')
+            # ...and a concurrent first request counted before the brewery committed
+            UserStats.objects.create(user_id=self.user, brewery_count=0)
+        self.assertEqual(UserStats.for_user(self.user.id).brewery_count, 1)
+
+        # Once the row exists, writes are counted in place
+        Brewery.objects.create(user_id=self.user, name='Boulder')
+        self.assertEqual(UserStats.for_user(self.user.id).brewery_count, 2)
+
+class CollectionTests(BreweryAPITestCase):
+
+    def test_shared_collection_membership(self):
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='testpassword')
+        collection = Collection.objects.create(user_id=other, name='Road trip')
+        collection.shared_with.add(self.user)
+
+        response = self.client.post('/api/notes/', {'name': 'Stops', 'collection': str(collection.id)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        note_id = response.json()['id']
+        response = self.client.patch(f'/api/notes/{note_id}/', {'content': 'Taprooms'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        # Unsharing drops the cached membership right away
+        collection.shared_with.remove(self.user)
+        response = self.client.post('/api/notes/', {'name': 'More stops', 'collection': str(collection.id)}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_shared_rows_are_not_duplicated(self):
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='testpassword')
+        third = CustomUser.objects.create_user(username='third', email='third@example.com', password='testpassword')
+        collection = Collection.objects.create(user_id=other, name='Road trip')
+        collection.shared_with.add(self.user, third)
+        Brewery.objects.create(user_id=other, name='Shared', collection=collection)
+        Brewery.objects.create(user_id=self.user, name='Own')
+        Brewery.objects.create(user_id=other, name='Hidden')
+
+        response = self.client.get('/api/breweries/?order_by=name', format='json')
+        self.assertEqual([brewery['name'] for brewery in response.json()['results']], ['Own', 'Shared'])
+
+        response = self.client.get(f'/api/collections/{collection.id}/', format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_collection_summary_and_sub_resources(self):
+        today = timezone.now().date()
+        collection = Collection.objects.create(user_id=self.user, name='Road trip')
+        denver = Brewery.objects.create(user_id=self.user, name='Denver', collection=collection, latitude=39.74, longitude=-104.99)
+        Brewery.objects.create(user_id=self.user, name='Moab', collection=collection, latitude=38.57, longitude=-109.55)
+        Visit.objects.create(brewery=denver, start_date=today - timedelta(days=3), end_date=today - timedelta(days=1))
+        Note.objects.create(user_id=self.user, name='Stops', collection=collection)
+
+        response = self.client.get('/api/collections/?summary=true', format='json')
+        summary = response.json()['results'][0]
+        self.assertNotIn('breweries', summary)
+        self.assertEqual((summary['brewery_count'], summary['visited_count'], summary['note_count']), (2, 1, 1))
+        self.assertEqual(summary['first_visit'], (today - timedelta(days=3)).isoformat())
+        self.assertEqual(summary['last_visit'], (today - timedelta(days=1)).isoformat())
+        self.assertEqual(summary['bbox'], [-109.55, 38.57, -104.99, 39.74])
+
+        response = self.client.get(f'/api/collections/{collection.id}/breweries/?page_size=1', format='json')
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(len(data['results']), 1)
+        response = self.client.get(f'/api/collections/{collection.id}/notes/', format='json')
+        self.assertEqual([note['name'] for note in response.json()['results']], ['Stops'])
+
+    def test_collection_itinerary(self):
+        today = timezone.now().date()
+        collection = Collection.objects.create(user_id=self.user, name='Road trip')
+        denver = Brewery.objects.create(user_id=self.user, name='Denver', collection=collection)
+        Visit.objects.create(brewery=denver, start_date=today + timedelta(days=1))
+        Note.objects.create(user_id=self.user, name='Packing', collection=collection, date=today)
+        Note.objects.create(user_id=self.user, name='Someday', collection=collection)
+
+        response = self.client.get(f'/api/collections/{collection.id}/itinerary/', format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([entry['type'] for entry in data['results']], ['note', 'visit', 'note'])
+        self.assertEqual(data['results'][0]['note']['name'], 'Packing')
+        self.assertEqual(data['results'][1]['brewery']['name'], 'Denver')
+        self.assertIsNone(data['results'][2]['date'])
+
+        response = self.client.get(f'/api/collections/{collection.id}/itinerary/?page_size=1', format='json')
+        self.assertEqual(len(response.json()['results']), 1)
+
+class BreweryImageTests(TemporaryMediaMixin, BreweryAPITestCase):
+
+    def test_background_image_processing(self):
+        brewery = Brewery.objects.create(user_id=self.user, name='Denver')
+        photo = BytesIO()
+        Image.new('RGB', (3000, 1000), 'orange').save(photo, format='JPEG')
+        upload = SimpleUploadedFile('photo.jpg', photo.getvalue(), content_type='image/jpeg')
+
+        response = self.client.post('/api/images/', {'brewery': str(brewery.id), 'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'pending')
+        self.assertIn('/media/originals/', response.json()['image'])
+
+        self.assertTrue(image_processing.process_next())
+        self.assertFalse(image_processing.process_next())
+        image = BreweryImage.objects.get(pk=response.json()['id'])
+        self.assertEqual(image.status, 'ready')
+        self.assertFalse(image.original)
+        with image.image.open('rb') as processed:
+            self.assertEqual(Image.open(processed).size, (1920, 640))
+
+        # The same content again is attached to the stored blob without processing
+        upload = SimpleUploadedFile('copy.jpg', photo.getvalue(), content_type='image/jpeg')
+        response = self.client.post('/api/images/', {'brewery': str(brewery.id), 'image': upload}, format='multipart')
+        self.assertEqual(response.json()['status'], 'ready')
+        copy = BreweryImage.objects.get(pk=response.json()['id'])
+        self.assertEqual((copy.image.name, copy.blob_id), (image.image.name, image.blob_id))
+        self.assertEqual(ImageBlob.objects.get(pk=image.blob_id).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertTrue(default_storage.exists(copy.image.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.delete()
+        self.assertFalse(ImageBlob.objects.filter(pk=copy.blob_id).exists())
+        self.assertFalse(default_storage.exists(copy.image.name))
+
+    def test_image_deleted_while_processing(self):
+        brewery = Brewery.objects.create(user_id=self.user, name='Denver')
+        photo = BytesIO()
+        Image.new('RGB', (400, 200), 'orange').save(photo, format='JPEG')
+        upload = SimpleUploadedFile('photo.jpg', photo.getvalue(), content_type='image/jpeg')
+        response = self.client.post('/api/images/', {'brewery': str(brewery.id), 'image': upload}, format='multipart')
+
+        encode = image_processing.encode
+        def encode_and_delete(original):
+            content = encode(original)
+            BreweryImage.objects.filter(pk=response.json()['id']).delete()
+            return content
+
+        with mock.patch.object(image_processing, 'encode', side_effect=encode_and_delete):
+            self.assertTrue(image_processing.process_next())
+        # The transcoded content is not stored for the deleted image
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_restart_requeues_processing_images(self):
+        brewery = Brewery.objects.create(user_id=self.user, name='Denver')
+        image = BreweryImage.objects.create(user_id=self.user, brewery=brewery, status='processing')
+
+        # A worker that is still running keeps its image
+        call_command('process-images', '--requeue-only', stdout=StringIO())
+        image.refresh_from_db()
+        self.assertEqual(image.status, 'processing')
+
+        version = get_data_version(self.user.id)
+        call_command('process-images', '--restarted', '--requeue-only', stdout=StringIO())
+        image.refresh_from_db()
+        self.assertEqual(image.status, 'pending')
+        # Cached responses showing the image as processing are invalidated
+        self.assertNotEqual(get_data_version(self.user.id), version)
+
+    def test_derived_image_sizes(self):
+        brewery = Brewery.objects.create(user_id=self.user, name='Denver')
+        photo = BytesIO()
+        Image.new('RGB', (1600, 800), 'orange').save(photo, format='WEBP')
+        # Stored before derived sizes existed
+        legacy = BreweryImage(user_id=self.user, brewery=brewery)
+        legacy.image.save('legacy.webp', ContentFile(photo.getvalue()))
+
+        response = self.client.get(f'/api/breweries/{brewery.id}/', format='json')
+        sizes = response.json()['images'][0]['sizes']
+        self.assertIn(f'/api/media-sizes/card/{legacy.image.name}', sizes['card'])
+
+        response = self.client.get(f'/api/media-sizes/card/{legacy.image.name}')
+        self.assertEqual(response.status_code, 302)
+        card = image_sizes.derived_name(legacy.image.name, 'card')
+        with default_storage.open(card, 'rb') as derived:
+            self.assertEqual(Image.open(derived).size, (800, 400))
+
+        self.assertTrue(image_sizes.size_urls(legacy.image.name)['card'].endswith(f'/media/{card}'))
+        self.assertEqual(self.client.get('/api/media-sizes/card/../settings.py').status_code, 404)
+
+    def test_missing_blob_sizes_are_generated(self):
+        photo = BytesIO()
+        Image.new('RGB', (1600, 800), 'orange').save(photo, format='WEBP')
+        # Generating the sizes after transcoding failed
+        blob = ImageBlob.store('ab' * 32, ContentFile(photo.getvalue()))
+
+        card_url = image_sizes.size_urls(blob.file.name)['card']
+        self.assertIn(f'/api/media-sizes/card/{blob.file.name}', card_url)
+        response = self.client.get(f'/api/media-sizes/card/{blob.file.name}')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(default_storage.exists(image_sizes.derived_name(blob.file.name, 'card')))
+
+    def test_resumable_image_upload(self):
+        brewery = Brewery.objects.create(user_id=self.user, name='Denver')
+        photo = BytesIO()
+        Image.new('RGB', (400, 200), 'orange').save(photo, format='JPEG')
+        content = photo.getvalue()
+        half = len(content) // 2
+
+        response = self.client.post('/api/image-uploads/', {
+            'brewery': str(brewery.id), 'filename': 'photo.jpg', 'size': len(content),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        url = f"/api/image-uploads/{response.json()['id']}/"
+
+        def send(part, offset):
+            return self.client.generic('PATCH', url, part, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+        self.assertEqual(send(content[:half], 0).status_code, 200)
+        # A part sent again after a lost response is refused with the offset to resume from
+        response = send(content[:half], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], half)
+        self.assertEqual(self.client.get(url)['Upload-Offset'], str(half))
+        self.assertEqual(self.client.post(f'{url}finalize/').status_code, 409)
+
+        self.assertEqual(send(content[half:], half).status_code, 200)
+        response = self.client.post(f'{url}finalize/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'pending')
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertEqual(self.client.post(f'{url}finalize/').status_code, 404)
+        self.assertEqual(BreweryImage.objects.count(), 1)
+
+        self.assertTrue(image_processing.process_next())
+        image = BreweryImage.objects.get(pk=response.json()['id'])
+        with image.image.open('rb') as processed:
+            self.assertEqual(Image.open(processed).size, (400, 200))
+
+    def test_upload_staging_files_are_removed(self):
+        brewery = Brewery.objects.create(user_id=self.user, name='Denver')
+        response = self.client.post('/api/image-uploads/', {
+            'brewery': str(brewery.id), 'filename': 'photo.jpg', 'size': 10,
+        }, format='json')
+        upload = ImageUpload.objects.get(pk=response.json()['id'])
+        self.assertTrue(os.path.exists(upload.path))
+
+        # Removed with the brewery, whose deletion cascades to the upload
+        with self.captureOnCommitCallbacks(execute=True):
+            brewery.delete()
+        self.assertFalse(os.path.exists(upload.path))
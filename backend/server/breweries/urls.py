@@ -12,6 +12,7 @@ router.register(r'transportations', TransportationViewSet, basename='transportat
 router.register(r'notes', NoteViewSet, basename='notes')
 router.register(r'checklists', ChecklistViewSet, basename='checklists')
 router.register(r'images', BreweryImageViewSet, basename='images')
+router.register(r'image-uploads', ImageUploadViewSet, basename='image-uploads')
 router.register(r'reverse-geocode', ReverseGeocodeViewSet, basename='reverse-geocode')
 router.register(r'categories', CategoryViewSet, basename='categories')
 router.register(r'ics-calendar', IcsCalendarGeneratorViewSet, basename='ics-calendar')
@@ -21,4 +22,6 @@ router.register(r'overpass', OverpassViewSet, basename='overpass')
 urlpatterns = [
     # Include the router under the 'api/' prefix
     path('', include(router.urls)),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', TileView.as_view(), name='tiles'),
+    path('media-sizes/<str:size>/<path:name>', ImageSizeView.as_view(), name='media-sizes'),
 ]
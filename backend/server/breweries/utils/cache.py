@@ -0,0 +1,81 @@
+import functools
+import hashlib
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.response import Response
+from breweries.utils.streaming import wants_stream
+
+# Data version shared by everything that shows other users' public breweries
+PUBLIC = 'public'
+# Cached responses are invalidated through the data version in their key, the timeout only evicts unused ones
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+
+def _version_key(scope):
+    return f'data-version:{scope}'
+
+
+def get_data_version(scope):
+    """
+    Returns the current data version of a user (by id) or of PUBLIC. Cached results are keyed
+    by it, so bumping the version invalidates all of them at once without deleting anything;
+    the stale entries simply age out of the cache.
+    """
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() so that concurrent first readers agree on a single version
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_data_version(*scopes):
+    # A fresh random token rather than a counter: the cache has no atomic increment
+    # shared between workers, and a token can never collide with an older version
+    cache.set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+
+def invalidate(*scopes):
+    """
+    Bumps the data versions of the given scopes now, so the rest of this request sees its own
+    writes, and again when the transaction commits: a concurrent request may have cached what
+    it read before the commit under the first new version.
+    """
+    scopes = [scope for scope in scopes if scope is not None]
+    if not scopes:
+        return
+    bump_data_version(*scopes)
+    transaction.on_commit(lambda: bump_data_version(*scopes))
+
+
+def cache_response(timeout=RESPONSE_CACHE_TIMEOUT):
+    """
+    Caches the data of successful responses of a view method per user, full URL (so query
+    parameters and pagination links are part of the key), day and the user's data version.
+    The day is included because is_visited flips as planned visits start.
+    Anonymous and streaming requests are not cached.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if not request.user.is_authenticated or wants_stream(request):
+                return view_method(self, request, *args, **kwargs)
+
+            url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+            cache_key = 'response:{}:{}:{}:{}'.format(
+                request.user.id, get_data_version(request.user.id), timezone.now().date().isoformat(), url_hash
+            )
+            data = cache.get(cache_key)
+            if data is not None:
+                return Response(data)
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                cache.set(cache_key, response.data, timeout)
+            return response
+        return wrapper
+    return decorator
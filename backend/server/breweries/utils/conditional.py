@@ -0,0 +1,61 @@
+import hashlib
+import json
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def make_etag(data):
+    """
+    Strong ETag for a JSON-serializable payload, derived from its content so that
+    every worker computes the same tag for the same data.
+    """
+    payload = json.dumps(data, cls=JSONEncoder, separators=(',', ':'))
+    return quote_etag(hashlib.sha1(payload.encode()).hexdigest())
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    # Weak comparison, as If-None-Match requires
+    return '*' in etags or etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in etags]
+
+
+def is_not_modified(request, etag, last_modified=None):
+    """
+    Evaluates the conditional headers of a GET. If-None-Match takes precedence, as it must;
+    If-Modified-Since is only consulted when the client sent no ETag.
+    """
+    if 'If-None-Match' in request.headers:
+        return etag_matches(request, etag)
+    if last_modified is None:
+        return False
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(last_modified.timestamp()) <= if_modified_since
+
+
+def not_modified(etag, last_modified=None):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Responses depend on the signed in user: browsers may keep them but must revalidate
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def validators_for(values):
+    """
+    ETag and Last-Modified for a row of validators, as returned by the validators() queryset
+    methods: the ETag covers every value, Last-Modified is the newest of the timestamps.
+    """
+    timestamps = [value for name, value in values.items() if name.endswith('updated_at') and value is not None]
+    return make_etag(values), max(timestamps, default=None)
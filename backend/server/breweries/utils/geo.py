@@ -0,0 +1,149 @@
+import math
+from django.contrib.gis.geos import MultiPolygon, Point, Polygon
+from django.contrib.gis.measure import D
+from rest_framework.exceptions import ParseError
+
+SRID = 4326
+# Used by the near filter when no radius is given
+DEFAULT_RADIUS_METERS = 50_000
+# Half of the earth's circumference, anything larger covers the whole globe
+MAX_RADIUS_METERS = 20_037_508
+METERS_PER_DEGREE = 111_320
+MAX_ZOOM = 22
+# Grid cells per tile width when clustering, about 128px cells on 512px map tiles
+CLUSTER_CELLS_PER_TILE = 4
+
+
+def _parse_floats(value, count, name):
+    parts = value.split(',')
+    if len(parts) != count:
+        raise ParseError({"error": f"{name} must be {count} comma separated numbers"})
+    try:
+        numbers = [float(part) for part in parts]
+    except ValueError:
+        raise ParseError({"error": f"{name} must be {count} comma separated numbers"})
+    if not all(math.isfinite(number) for number in numbers):
+        raise ParseError({"error": f"{name} must be {count} comma separated numbers"})
+    return numbers
+
+
+def _check_latitude(latitude, name):
+    if not -90 <= latitude <= 90:
+        raise ParseError({"error": f"{name} latitude must be between -90 and 90"})
+
+
+def _wrap_longitude(longitude):
+    if -180 <= longitude <= 180:
+        return longitude
+    return (longitude + 180) % 360 - 180
+
+
+def parse_bbox(value):
+    """
+    Parses `minLon,minLat,maxLon,maxLat` into the polygon covering that viewport. A box whose
+    west edge is east of its east edge crosses the antimeridian and is split in two.
+    """
+    min_lon, min_lat, max_lon, max_lat = _parse_floats(value, 4, 'in_bbox')
+    _check_latitude(min_lat, 'in_bbox')
+    _check_latitude(max_lat, 'in_bbox')
+    if min_lat > max_lat:
+        raise ParseError({"error": "in_bbox minimum latitude must not be greater than the maximum latitude"})
+
+    # Maps report longitudes beyond +-180 once the user has panned around the globe
+    if max_lon - min_lon >= 360:
+        min_lon, max_lon = -180, 180
+    else:
+        min_lon, max_lon = _wrap_longitude(min_lon), _wrap_longitude(max_lon)
+
+    if min_lon <= max_lon:
+        return Polygon.from_bbox((min_lon, min_lat, max_lon, max_lat))
+    return MultiPolygon(
+        Polygon.from_bbox((min_lon, min_lat, 180, max_lat)),
+        Polygon.from_bbox((-180, min_lat, max_lon, max_lat)),
+    )
+
+
+def _make_point(latitude, longitude, name):
+    _check_latitude(latitude, name)
+    if not -180 <= longitude <= 180:
+        raise ParseError({"error": f"{name} longitude must be between -180 and 180"})
+    return Point(longitude, latitude, srid=SRID)
+
+
+def parse_lat_lon(latitude, longitude):
+    """
+    Parses separate `lat` and `lon` query parameters into a point.
+    """
+    if latitude in (None, '') or longitude in (None, ''):
+        raise ParseError({"error": "lat and lon are required"})
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except ValueError:
+        raise ParseError({"error": "lat and lon must be numbers"})
+    return _make_point(latitude, longitude, 'lat/lon')
+
+
+def parse_near(value, radius=None):
+    """
+    Parses `lat,lon` and a radius in meters into the center point and the radius.
+    """
+    latitude, longitude = _parse_floats(value, 2, 'near')
+    center = _make_point(latitude, longitude, 'near')
+
+    if radius in (None, ''):
+        radius = DEFAULT_RADIUS_METERS
+    try:
+        radius = float(radius)
+    except ValueError:
+        raise ParseError({"error": "radius must be a number of meters"})
+    if not 0 < radius <= MAX_RADIUS_METERS:
+        raise ParseError({"error": f"radius must be between 0 and {MAX_RADIUS_METERS} meters"})
+    return center, radius
+
+
+def parse_zoom(value):
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        raise ParseError({"error": "zoom must be a whole number"})
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ParseError({"error": f"zoom must be between 0 and {MAX_ZOOM}"})
+    return zoom
+
+
+def cluster_cell_size(zoom):
+    """
+    Width in degrees of the clustering grid at a map zoom level, where one tile spans 360 / 2^zoom degrees.
+    """
+    return 360 / 2 ** zoom / CLUSTER_CELLS_PER_TILE
+
+
+def degrees_around(center, radius):
+    """
+    A distance in degrees that is at least `radius` meters in every direction from the
+    center, used to narrow a geodetic distance query down with the spatial index.
+    """
+    latitude_degrees = radius / METERS_PER_DEGREE
+    cos_latitude = math.cos(math.radians(min(abs(center.y) + latitude_degrees, 90)))
+    if cos_latitude < 1e-6:
+        return 360
+    return min(latitude_degrees / cos_latitude, 360)
+
+
+def filter_by_location(queryset, query_params, field='point'):
+    """
+    Applies the `in_bbox` and `near`/`radius` query parameters to a queryset with a point field.
+    """
+    bbox = query_params.get('in_bbox')
+    if bbox:
+        queryset = queryset.filter(**{f'{field}__intersects': parse_bbox(bbox)})
+
+    near = query_params.get('near')
+    if near:
+        center, radius = parse_near(near, query_params.get('radius'))
+        queryset = queryset.filter(**{
+            # Planar prefilter answered by the GiST index, then the exact spheroid distance
+            f'{field}__dwithin': (center, degrees_around(center, radius)),
+            f'{field}__distance_lte': (center, D(m=radius)),
+        })
+    return queryset
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from breweries.models import IMAGE_FAILED, IMAGE_PENDING, IMAGE_PROCESSING, IMAGE_READY, Brewery, BreweryImage, ImageBlob, ImageUpload
+from breweries.utils import image_sizes
+from breweries.utils.cache import invalidate
+from breweries.utils.membership import SharedWith
+
+logger = logging.getLogger(__name__)
+
+# What ResizedImageField used to do synchronously in the upload request
+MAX_DIMENSIONS = (1920, 1080)
+WEBP_QUALITY = 75
+# Failed images are retried by `manage.py process-images --retry-failed` up to this many attempts
+MAX_ATTEMPTS = 3
+# An image left processing this long belongs to a worker that died, e.g. in a gunicorn restart
+STALE_AFTER = timedelta(minutes=10)
+# Threads per gunicorn worker. Pillow releases the GIL while decoding and encoding
+WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='image-processing')
+    return _executor
+
+
+def enqueue(image_id):
+    """
+    Processes the image in the worker pool once the transaction that stored it commits. The row
+    itself is the queue entry, so an image whose worker never ran is picked up by process-images.
+    """
+    transaction.on_commit(lambda: _get_executor().submit(_run, image_id))
+
+
+def _run(image_id):
+    try:
+        process_next(image_id)
+    except Exception:
+        logger.exception('Processing image %s failed', image_id)
+    finally:
+        # Worker threads open their own database connections
+        close_old_connections()
+
+
+def claim(image_id=None):
+    """
+    Marks the given pending image, or the oldest one, as processing and returns it. Rows are
+    locked with SKIP LOCKED, so concurrent workers never claim the same image.
+    """
+    with transaction.atomic():
+        queue = BreweryImage.objects.select_for_update(skip_locked=True).filter(status=IMAGE_PENDING)
+        if image_id is not None:
+            queue = queue.filter(pk=image_id)
+        image = queue.order_by('updated_at').first()
+        if image is None:
+            return None
+        image.status = IMAGE_PROCESSING
+        image.attempts += 1
+        image.save(update_fields=['status', 'attempts', 'updated_at'])
+    return image
+
+
+def process_next(image_id=None):
+    """
+    Claims and transcodes one pending image. Returns False when there was none to claim.
+    """
+    image = claim(image_id)
+    if image is None:
+        return False
+    original_name = image.original.name
+    try:
+        transcode(image)
+    except Exception as e:
+        logger.exception('Transcoding image %s failed', image.pk)
+        # Unless the image was deleted or given a new original in the meantime
+        if claimed_row(image, original_name).exists():
+            image.status = IMAGE_FAILED
+            image.error = str(e)
+            image.save(update_fields=['status', 'error', 'updated_at'])
+    return True
+
+
+def claimed_row(image, original_name):
+    # The row of an image as claim() left it, which the result of its transcoding belongs to
+    return BreweryImage.objects.filter(pk=image.pk, status=IMAGE_PROCESSING, original=original_name)
+
+
+def hash_file(file):
+    """
+    The SHA-256 of an uploaded or stored file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def attach_upload(upload):
+    """
+    The fields a BreweryImage gets for an upload. Content that is already stored is attached to
+    its blob and ready at once; new content is kept as the original and waits for processing.
+    """
+    content_hash = hash_file(upload)
+    blob = ImageBlob.acquire(content_hash)
+    if blob is not None:
+        return {'image': blob.file.name, 'blob': blob, 'content_hash': content_hash, 'original': None, 'status': IMAGE_READY}
+    return {'image': '', 'blob': None, 'content_hash': content_hash, 'original': upload, 'status': IMAGE_PENDING}
+
+
+def encode(original):
+    with original.open('rb') as file:
+        picture = ImageOps.exif_transpose(Image.open(file))
+        picture.thumbnail(MAX_DIMENSIONS)
+        if picture.mode not in ('RGB', 'RGBA'):
+            picture = picture.convert('RGBA' if 'A' in picture.getbands() else 'RGB')
+        output = BytesIO()
+        picture.save(output, format='WEBP', quality=WEBP_QUALITY)
+    return ContentFile(output.getvalue())
+
+
+def transcode(image):
+    """
+    Attaches the image to the blob of its original, transcoding the original to a WEBP no larger
+    than MAX_DIMENSIONS and generating the derived sizes when the content is new, and removes the
+    original. Saved through the model, so the usual signals invalidate cached responses.
+    """
+    content_hash = image.content_hash or hash_file(image.original)
+    original_name, storage = image.original.name, image.original.storage
+    # Encoded before the row is locked, so editing the image does not wait for it
+    content = None if ImageBlob.objects.filter(pk=content_hash).exists() else encode(image.original)
+
+    stored = False
+    with transaction.atomic():
+        # The image may have been deleted or given a new original while it was encoded. The blob
+        # reference is only taken for the locked row, and a failed save rolls it back with the row
+        if not claimed_row(image, original_name).select_for_update().exists():
+            logger.info('Image %s changed while it was transcoded, dropping the result', image.pk)
+            return
+        blob = ImageBlob.acquire(content_hash)
+        if blob is None:
+            blob = ImageBlob.store(content_hash, content or encode(image.original))
+            stored = True
+        image.image = blob.file.name
+        image.blob = blob
+        image.content_hash = content_hash
+        image.original = None
+        image.status = IMAGE_READY
+        image.error = None
+        image.save(update_fields=['image', 'blob', 'content_hash', 'original', 'status', 'error', 'updated_at'])
+        transaction.on_commit(lambda: storage.delete(original_name))
+    if stored:
+        generate_sizes(blob.file.name)
+
+
+def generate_sizes(name):
+    # A missing size is generated on first use, so a failure here does not fail the image
+    try:
+        image_sizes.generate_all(name)
+    except Exception:
+        logger.exception('Generating the sizes of %s failed', name)
+
+
+def enqueue_sizes(name):
+    """
+    Generates the derived sizes of a media image in the worker pool, for images that are stored
+    without going through the processing queue, like profile pictures.
+    """
+    transaction.on_commit(lambda: _get_executor().submit(generate_sizes, name))
+
+
+def requeue(retry_failed=False, stale_after=STALE_AFTER):
+    """
+    Puts images back in the queue: those left processing by a dead worker and, with retry_failed,
+    failed ones that have attempts left. Returns how many were requeued. When the server starts
+    no worker is alive, so every processing image is requeued with a stale_after of zero.
+    """
+    queues = [BreweryImage.objects.filter(status=IMAGE_PROCESSING, updated_at__lt=timezone.now() - stale_after)]
+    if retry_failed:
+        queues.append(BreweryImage.objects.filter(status=IMAGE_FAILED, attempts__lt=MAX_ATTEMPTS))
+    count = 0
+    for queue in queues:
+        images = dict(queue.values_list('pk', 'brewery_id'))
+        count += queue.filter(pk__in=images).update(status=IMAGE_PENDING, updated_at=timezone.now())
+        # Queryset updates send no signals, so cached responses showing the old status are
+        # invalidated here for everyone who sees the breweries
+        invalidate(*brewery_audience(set(images.values())))
+    return count
+
+
+def brewery_audience(brewery_ids):
+    """
+    The users who see the given breweries: their owners and the users their collections are
+    shared with.
+    """
+    breweries = Brewery.objects.filter(pk__in=brewery_ids)
+    shared_ids = SharedWith.objects.filter(
+        collection_id__in=breweries.values('collection_id')
+    ).values_list('customuser_id', flat=True)
+    return {*breweries.values_list('user_id', flat=True), *shared_ids}
+
+
+def remove_expired_uploads():
+    """
+    Removes chunked uploads that received no part for ImageUpload.EXPIRES_AFTER, with their
+    staging files. Returns how many were removed.
+    """
+    expired = ImageUpload.objects.filter(updated_at__lt=timezone.now() - ImageUpload.EXPIRES_AFTER)
+    count = 0
+    for upload in expired:
+        upload.delete()
+        count += 1
+    return count
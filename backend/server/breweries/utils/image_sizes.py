@@ -0,0 +1,85 @@
+import os
+import tempfile
+from io import BytesIO
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from main.utils import media_url, public_base_url
+
+# Derived sizes by the width of the box they fit in. The full size is the stored image itself,
+# which processing already fits in 1920 x 1080
+IMAGE_SIZES = {
+    'thumbnail': 320,
+    'card': 800,
+}
+FULL_SIZE = 'full'
+FULL_SIZE_WIDTH = 1920
+WEBP_QUALITY = 75
+# Derived images live next to the media they are made from, under this directory
+DERIVED_DIR = 'derived'
+# Media directories derived sizes can be requested for
+SOURCE_DIRS = ('blobs/', 'images/', 'profile-pics/')
+
+
+def derived_name(name, size):
+    """
+    The media name of a derived size, fixed by the source name so it can be found without
+    a database column: images/<uuid>.webp -> derived/card/images/<uuid>.webp
+    """
+    return f'{DERIVED_DIR}/{size}/{os.path.splitext(name)[0]}.webp'
+
+
+def is_source_name(name):
+    return name.startswith(SOURCE_DIRS) and '..' not in name.split('/') and not os.path.isabs(name)
+
+
+def generate(name, size):
+    """
+    Writes the derived size of a media file unless it exists and returns its name. The file is
+    written next to its final path and renamed into place, so concurrent requests for the same
+    size never see a partial file.
+    """
+    target = derived_name(name, size)
+    path = default_storage.path(target)
+    if os.path.exists(path):
+        return target
+
+    width = IMAGE_SIZES[size]
+    with default_storage.open(name, 'rb') as source:
+        picture = ImageOps.exif_transpose(Image.open(source))
+        picture.thumbnail((width, width))
+        if picture.mode not in ('RGB', 'RGBA'):
+            picture = picture.convert('RGBA' if 'A' in picture.getbands() else 'RGB')
+        output = BytesIO()
+        picture.save(output, format='WEBP', quality=WEBP_QUALITY)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as partial:
+        partial.write(output.getvalue())
+    os.replace(partial.name, path)
+    return target
+
+
+def generate_all(name):
+    for size in IMAGE_SIZES:
+        generate(name, size)
+
+
+def size_urls(name):
+    """
+    URLs of every size of a media file. Sizes that have not been generated yet, as for images
+    stored before derived sizes existed, point to the endpoint that generates them on first use.
+    """
+    urls = {}
+    for size in IMAGE_SIZES:
+        target = derived_name(name, size)
+        if os.path.exists(default_storage.path(target)):
+            urls[size] = media_url(target)
+        else:
+            urls[size] = f'{public_base_url()}/api/media-sizes/{size}/{name}'
+    urls[FULL_SIZE] = media_url(name)
+    return urls
+
+
+def srcset(urls):
+    widths = {**IMAGE_SIZES, FULL_SIZE: FULL_SIZE_WIDTH}
+    return ', '.join(f'{urls[size]} {widths[size]}w' for size in widths)
@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.db import transaction
+from breweries.models import Collection
+
+# Seconds a membership answer is shared between requests; changes to shared_with drop it right away
+MEMBERSHIP_CACHE_TIMEOUT = 60
+
+SharedWith = Collection.shared_with.through
+
+
+def _cache_key(collection_id, user_id):
+    return f'collection-member:{collection_id}:{user_id}'
+
+
+def is_shared_with(request, collection_id):
+    """
+    Whether the collection is shared with the request's user, answered by one indexed EXISTS
+    on the shared_with table. The answer is remembered for the rest of the request, so checks
+    of many objects in one collection cost a single lookup, and cached briefly across requests.
+    """
+    user = request.user
+    if collection_id is None or not user.is_authenticated:
+        return False
+
+    memo = getattr(request, '_collection_membership', None)
+    if memo is None:
+        memo = request._collection_membership = {}
+    if collection_id in memo:
+        return memo[collection_id]
+
+    key = _cache_key(collection_id, user.id)
+    shared = cache.get(key)
+    if shared is None:
+        shared = SharedWith.objects.filter(collection_id=collection_id, customuser_id=user.id).exists()
+        cache.set(key, shared, MEMBERSHIP_CACHE_TIMEOUT)
+    memo[collection_id] = shared
+    return shared
+
+
+def forget_memberships(pairs):
+    """
+    Drops the cached answers for (collection id, user id) pairs, now and again once the
+    transaction commits, so an answer read before the commit is not kept.
+    """
+    keys = [_cache_key(collection_id, user_id) for collection_id, user_id in pairs]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
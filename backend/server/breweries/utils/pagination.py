@@ -1,6 +1,190 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import datetime
+import decimal
+import json
+import uuid
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from breweries.utils import streaming
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 25
     page_size_query_param = 'page_size'
-    max_page_size = 1000
\ No newline at end of file
+    max_page_size = 1000
+
+class OptionalResultsSetPagination(StandardResultsSetPagination):
+    """
+    Paginates only when the client asks for a page or page size, so endpoints that have
+    always returned a plain list keep doing so for existing callers.
+    """
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the queryset's current ordering, with the primary key appended
+    as a tiebreaker. Pages are fetched with a range condition on the sort columns instead of an
+    OFFSET and no total count is computed, so scrolling cost does not grow with the table.
+
+    The sort columns must not be null, which holds for the orderings the viewsets apply
+    (updated_at, lower(name), rating and latest visit, the last two exclude nulls).
+    """
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        position, reverse = self.decode_cursor(request)
+
+        ordering = [self.invert(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not ordering:
+            ordering = ['-pk']
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            # The primary key makes the sort order total, with the same direction as the last column
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def keyset_filter(ordering, position):
+        """
+        Rows strictly after `position` in `ordering`. The expanded form
+        (a > x) OR (a = x AND b > y) ... is guarded by a >= x so the leading
+        sort column can still be used as an index range.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        first = ordering[0]
+        guard = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+        return guard & condition
+
+    def get_position(self, instance):
+        return [self.encode_value(getattr(instance, field.lstrip('-'))) for field in self.ordering]
+
+    @staticmethod
+    def encode_value(value):
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        if isinstance(value, (uuid.UUID, decimal.Decimal)):
+            return str(value)
+        return value
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = cursor['p'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            # The ordering changed since the cursor was issued
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse=False):
+        cursor = {'p': position}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+def get_paginator(request, pagination_class):
+    """
+    Returns a KeysetPagination when the client opts in with ?pagination=cursor (or is following
+    a cursor link), otherwise an instance of the viewset's regular pagination class.
+    """
+    if request.query_params.get('pagination') == 'cursor' or KeysetPagination.cursor_query_param in request.query_params:
+        return KeysetPagination()
+    return pagination_class()
+
+class PaginatedResponseMixin:
+    """
+    For viewsets: answers with a streamed list for ?stream=true, otherwise with a page of the
+    paginator get_paginator picks, or a plain list when the pagination class does not paginate.
+    """
+    def paginate_and_respond(self, queryset, request, pagination_class=None):
+        if streaming.wants_stream(request):
+            return streaming.streaming_response(queryset, self.get_serializer_class(), self.get_serializer_context())
+        paginator = get_paginator(request, pagination_class or self.pagination_class)
+        page = paginator.paginate_queryset(queryset, request)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
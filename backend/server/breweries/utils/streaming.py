@@ -0,0 +1,50 @@
+import json
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+# Rows fetched from the database cursor, and serialized together, per step of the stream
+STREAM_CHUNK_SIZE = 200
+
+
+def wants_stream(request):
+    return request.query_params.get('stream', 'false') == 'true'
+
+
+def stream_json_array(queryset, serializer_class, context=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yields the serialized queryset as the pieces of a JSON array. Rows are read with
+    .iterator(chunk_size=...), which also runs the queryset's prefetches once per chunk,
+    so only one chunk of objects is held in memory however many rows there are.
+    """
+    yield '['
+    separator = ''
+    chunk = []
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(instance)
+        if len(chunk) == chunk_size:
+            yield separator + _encode_chunk(chunk, serializer_class, context)
+            separator = ','
+            chunk = []
+    if chunk:
+        yield separator + _encode_chunk(chunk, serializer_class, context)
+    yield ']'
+
+
+def _encode_chunk(chunk, serializer_class, context):
+    data = serializer_class(chunk, many=True, context=context).data
+    # Same output as the JSON renderer, without the brackets of the list
+    return ','.join(
+        json.dumps(item, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+        for item in data
+    )
+
+
+def streaming_response(queryset, serializer_class, context=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Returns the same JSON list as serializing the queryset with many=True, written to the
+    client chunk by chunk instead of being built in memory first.
+    """
+    return StreamingHttpResponse(
+        stream_json_array(queryset, serializer_class, context, chunk_size),
+        content_type='application/json',
+    )
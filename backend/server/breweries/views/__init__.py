@@ -5,9 +5,12 @@ from .category_view import *
 from .checklist_view import *
 from .collection_view import *
 from .generate_description_view import *
+from .image_upload_view import *
+from .image_size_view import *
 from .ics_calendar_view import *
 from .note_view import *
 from .overpass_view import *
 from .reverse_geocode_view import *
 from .stats_view import *
+from .tile_view import *
 from .transportation_view import *
\ No newline at end of file
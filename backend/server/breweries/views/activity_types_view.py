@@ -3,11 +3,13 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from breweries.models import Brewery
+from breweries.utils.cache import cache_response
 
 class ActivityTypesView(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     @action(detail=False, methods=['get'])
+    @cache_response()
     def types(self, request):
         """
         Retrieve a list of distinct activity types for breweries associated with the current user.
@@ -2,9 +2,11 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db import transaction
 from django.db.models import Q
-from breweries.models import Brewery, BreweryImage
+from breweries.models import IMAGE_PENDING, Brewery, BreweryImage, ImageBlob
 from breweries.serializers import BreweryImageSerializer
+from breweries.utils import image_processing, membership
 import uuid
 
 class BreweryImageViewSet(viewsets.ModelViewSet):
@@ -51,14 +53,9 @@ class BreweryImageViewSet(viewsets.ModelViewSet):
         except Brewery.DoesNotExist:
             return Response({"error": "Brewery not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        if brewery.user_id != request.user:
-            # Check if the brewery has a collection
-            if brewery.collection:
-                # Check if the user is in the collection's shared_with list
-                if not brewery.collection.shared_with.filter(id=request.user.id).exists():
-                    return Response({"error": "User does not have permission to access this brewery"}, status=status.HTTP_403_FORBIDDEN)
-            else:
-                return Response({"error": "User does not own this brewery"}, status=status.HTTP_403_FORBIDDEN)
+        error = brewery_access_error(request, brewery)
+        if error is not None:
+            return error
         
         return super().create(request, *args, **kwargs)
     
@@ -125,4 +122,41 @@ class BreweryImageViewSet(viewsets.ModelViewSet):
         return BreweryImage.objects.filter(user_id=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user_id=self.request.user)
\ No newline at end of file
+        save_for_processing(serializer, user_id=self.request.user)
+
+    def perform_update(self, serializer):
+        save_for_processing(serializer)
+
+def brewery_access_error(request, brewery):
+    """
+    The error response when the user may not add images to the brewery, None when they may.
+    """
+    if brewery.user_id_id != request.user.id:
+        # Check if the brewery has a collection
+        if brewery.collection_id:
+            # Check if the user is in the collection's shared_with list
+            if not membership.is_shared_with(request, brewery.collection_id):
+                return Response({"error": "User does not have permission to access this brewery"}, status=status.HTTP_403_FORBIDDEN)
+        else:
+            return Response({"error": "User does not own this brewery"}, status=status.HTTP_403_FORBIDDEN)
+    return None
+
+@transaction.atomic
+def save_for_processing(serializer, **kwargs):
+    # Uploads are stored as they are and transcoded in the background, so the request
+    # does not wait for decoding and encoding. Known content is attached to its blob instead
+    upload = serializer.validated_data.pop('image', None)
+    if upload is None:
+        return serializer.save(**kwargs)
+    replaced_blob = serializer.instance.blob_id if serializer.instance else None
+    replaced_original = serializer.instance.original if serializer.instance else None
+    if replaced_original:
+        # A pending image keeps its original until it is transcoded, the new upload replaces it
+        name, storage = replaced_original.name, replaced_original.storage
+        transaction.on_commit(lambda: storage.delete(name))
+    image = serializer.save(**image_processing.attach_upload(upload), attempts=0, error=None, **kwargs)
+    if replaced_blob:
+        ImageBlob.release(replaced_blob)
+    if image.status == IMAGE_PENDING:
+        image_processing.enqueue(image.pk)
+    return image
@@ -1,6 +1,6 @@
 from django.db import transaction
 from rest_framework.decorators import action
-from rest_framework import viewsets
+from rest_framework import generics, viewsets
 from django.db.models.functions import Lower
 from rest_framework.response import Response
 from breweries.models import Brewery, Category
@@ -10,9 +10,24 @@ from django.db.models import Q
 from breweries.permissions import IsOwnerOrSharedWithFullAccess
 from django.shortcuts import get_object_or_404
 from django.db.models import Max
-from breweries.utils import pagination
-
-class BreweryViewSet(viewsets.ModelViewSet):
+from breweries.utils import conditional, geo, membership, pagination, visibility
+from breweries.utils.cache import PUBLIC, cache_response, get_data_version
+from django.core.cache import cache
+import hashlib
+
+# Seconds an autocomplete result stays cached for a user
+AUTOCOMPLETE_CACHE_TIMEOUT = 60
+AUTOCOMPLETE_MAX_RESULTS = 25
+
+# Column order of the rows returned by the pins action
+PIN_FIELDS = ['id', 'latitude', 'longitude', 'icon', 'is_visited', 'name']
+CLUSTER_FIELDS = ['latitude', 'longitude', 'count']
+NEAREST_DEFAULT_LIMIT = 10
+NEAREST_MAX_LIMIT = 100
+# Clusters are invalidated through the data version in their key, the timeout only evicts unused ones
+CLUSTER_CACHE_TIMEOUT = 60 * 60 * 24
+
+class BreweryViewSet(pagination.PaginatedResponseMixin, viewsets.ModelViewSet):
     serializer_class = BrewerySerializer
     permission_classes = [IsOwnerOrSharedWithFullAccess]
     pagination_class = pagination.StandardResultsSetPagination
@@ -61,30 +76,40 @@ class BreweryViewSet(viewsets.ModelViewSet):
 
         return queryset.order_by(ordering)
 
+    def apply_location_filters(self, queryset):
+        # ?in_bbox=minLon,minLat,maxLon,maxLat and ?near=lat,lon&radius=meters, see breweries.utils.geo
+        return geo.filter_by_location(queryset, self.request.query_params)
+
     def get_queryset(self):
         print(self.request.user)
         # if the user is not authenticated return only public breweries for retrieve action
         if not self.request.user.is_authenticated:
             if self.action == 'retrieve':
-                return Brewery.objects.filter(is_public=True).distinct().order_by('-updated_at')
+                return Brewery.objects.filter(is_public=True).for_serialization().order_by('-updated_at')
             return Brewery.objects.none()
 
-        if self.action == 'retrieve':
-            # For individual brewery retrieval, include public breweries
-            return Brewery.objects.filter(
-                Q(is_public=True) | Q(user_id=self.request.user.id) | Q(collection__shared_with=self.request.user)
-            ).distinct().order_by('-updated_at')
-        else:
-            # For other actions, include user's own breweries and shared breweries
-            return Brewery.objects.filter(
-                Q(user_id=self.request.user.id) | Q(collection__shared_with=self.request.user)
-            ).distinct().order_by('-updated_at')
+        # For individual brewery retrieval include public breweries, for other actions
+        # the user's own breweries and shared breweries
+        return visibility.visible_to(
+            Brewery.objects.all(), self.request, include_public=self.action == 'retrieve'
+        ).for_serialization().order_by('-updated_at')
+
+    @cache_response()
+    def list(self, request, *args, **kwargs):
+        queryset = self.apply_sorting(self.apply_location_filters(self.get_queryset()))
+        return self.paginate_and_respond(queryset, request)
 
     def retrieve(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+        # Answer conditional requests from the validators, before loading and serializing the brewery
+        values = generics.get_object_or_404(queryset.prefetch_related(None).order_by().validators(), pk=kwargs['pk'])
+        etag, last_modified = conditional.validators_for(values)
+        if conditional.is_not_modified(request, etag, last_modified):
+            return conditional.not_modified(etag, last_modified)
+
         brewery = get_object_or_404(queryset, pk=kwargs['pk'])
         serializer = self.get_serializer(brewery)
-        return Response(serializer.data)
+        return conditional.set_validators(Response(serializer.data), etag, last_modified)
 
     def perform_update(self, serializer):
         brewery = serializer.save()
@@ -93,6 +118,7 @@ class BreweryViewSet(viewsets.ModelViewSet):
             brewery.save()
         
     @action(detail=False, methods=['get'])
+    @cache_response()
     def filtered(self, request):
         types = request.query_params.get('types', '').split(',')
         is_visited = request.query_params.get('is_visited', 'all')
@@ -112,33 +138,24 @@ class BreweryViewSet(viewsets.ModelViewSet):
         queryset = Brewery.objects.filter(
             category__in=Category.objects.filter(name__in=types, user_id=request.user),
             user_id=request.user.id
-        )
+        ).for_serialization()
 
-        # Handle is_visited filtering
+        # Handle is_visited filtering in the database using the annotation
         if is_visited.lower() == 'true':
-            serializer = self.get_serializer(queryset, many=True)
-            filtered_ids = [
-                brewery.id for brewery, serialized_brewery in zip(queryset, serializer.data)
-                if serialized_brewery['is_visited']
-            ]
-            queryset = queryset.filter(id__in=filtered_ids)
+            queryset = queryset.filter(is_visited=True)
         elif is_visited.lower() == 'false':
-            serializer = self.get_serializer(queryset, many=True)
-            filtered_ids = [
-                brewery.id for brewery, serialized_brewery in zip(queryset, serializer.data)
-                if not serialized_brewery['is_visited']
-            ]
-            queryset = queryset.filter(id__in=filtered_ids)
+            queryset = queryset.filter(is_visited=False)
         # If is_visited is 'all' or any other value, we don't apply additional filtering
 
         # Apply sorting
-        queryset = self.apply_sorting(queryset)
+        queryset = self.apply_sorting(self.apply_location_filters(queryset))
 
         # Paginate and respond
         breweries = self.paginate_and_respond(queryset, request)
         return breweries
         
     @action(detail=False, methods=['get'])
+    @cache_response()
     def all(self, request):
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
@@ -156,12 +173,86 @@ class BreweryViewSet(viewsets.ModelViewSet):
             )
         queryset = Brewery.objects.filter(
             Q(user_id=request.user.id)
-        )
-        queryset = self.apply_sorting(queryset)
-        serializer = self.get_serializer(queryset, many=True)
-       
-        return Response(serializer.data)
+        ).for_serialization()
+        queryset = self.apply_sorting(self.apply_location_filters(queryset))
+        return self.paginate_and_respond(queryset, request, pagination.OptionalResultsSetPagination)
     
+    @action(detail=False, methods=['get'])
+    def pins(self, request):
+        """
+        Compact map markers for the user's breweries that have coordinates: one row per brewery
+        with the columns named in `fields`, read by a single values query. The ETag is derived
+        from the rows, so a map whose breweries have not changed is answered with a 304.
+        Accepts the in_bbox and near filters so the map can load only the visible viewport.
+
+        With ?cluster=true&zoom=<z> the rows are grid clusters for that zoom level instead,
+        computed in the database and cached per user, zoom, filters and data version.
+        """
+        if not request.user.is_authenticated:
+            return Response({"error": "User is not authenticated"}, status=400)
+
+        queryset = Brewery.objects.filter(
+            user_id=request.user.id, latitude__isnull=False, longitude__isnull=False
+        )
+        if request.query_params.get('include_collections', 'true') == 'false':
+            queryset = queryset.filter(collection=None)
+        queryset = self.apply_location_filters(queryset)
+
+        if request.query_params.get('cluster', 'false') == 'true':
+            fields, rows = CLUSTER_FIELDS, self.get_cluster_rows(queryset, request)
+        else:
+            fields = PIN_FIELDS
+            rows = [
+                [str(id), float(latitude), float(longitude), icon, is_visited, name]
+                for id, latitude, longitude, icon, is_visited, name in queryset.with_is_visited().order_by('id').values_list(
+                    'id', 'latitude', 'longitude', 'category__icon', 'is_visited', 'name'
+                )
+            ]
+
+        etag = conditional.make_etag(rows)
+        if conditional.etag_matches(request, etag):
+            return conditional.not_modified(etag)
+        return conditional.set_validators(Response({'fields': fields, 'rows': rows}), etag)
+
+    def get_cluster_rows(self, queryset, request):
+        zoom = geo.parse_zoom(request.query_params.get('zoom'))
+        filters = '&'.join(
+            f'{param}={request.query_params.get(param, "")}'
+            for param in ['in_bbox', 'near', 'radius', 'include_collections']
+        )
+        cache_key = 'pin-clusters:{}:{}:{}:{}'.format(
+            request.user.id, zoom, hashlib.md5(filters.encode()).hexdigest(), get_data_version(request.user.id)
+        )
+        rows = cache.get(cache_key)
+        if rows is None:
+            rows = sorted(
+                ([round(center.y, 6), round(center.x, 6), count] for center, count in queryset.clusters(geo.cluster_cell_size(zoom))),
+                key=lambda row: (-row[2], row[0], row[1]),
+            )
+            cache.set(cache_key, rows, CLUSTER_CACHE_TIMEOUT)
+        return rows
+
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        """
+        The breweries closest to ?lat=&lon=, nearest first, with their distance in meters. Covers the
+        same breweries as retrieve: the user's own, those in collections shared with them and public ones.
+        """
+        center = geo.parse_lat_lon(request.query_params.get('lat'), request.query_params.get('lon'))
+        try:
+            limit = min(max(int(request.query_params.get('limit', NEAREST_DEFAULT_LIMIT)), 1), NEAREST_MAX_LIMIT)
+        except ValueError:
+            return Response({"error": "Limit must be a number"}, status=400)
+
+        breweries = visibility.visible_to(
+            Brewery.objects.all(), request, include_public=True
+        ).for_serialization().nearest(center, limit)
+        serializer = self.get_serializer(breweries, many=True)
+        return Response([
+            {**data, 'distance': round(brewery.distance.m, 1)}
+            for data, brewery in zip(serializer.data, breweries)
+        ])
+
     @action(detail=False, methods=['get'])
     def search(self, request):
         query = self.request.query_params.get('query', '')
@@ -171,43 +262,58 @@ class BreweryViewSet(viewsets.ModelViewSet):
         
         if property not in ['name', 'type', 'location', 'description', 'activity_types']:
             property = 'all'
+        # breweries no longer have a type, the closest searchable field is the activity types
+        if property == 'type':
+            property = 'activity_types'
 
-        queryset = Brewery.objects.none()
+        queryset = Brewery.objects.filter(
+            Q(user_id=request.user.id) | Q(is_public=True)
+        ).search(query, property)
 
-        if property == 'name':
-            queryset = Brewery.objects.filter(
-                (Q(name__icontains=query)) &
-                (Q(user_id=request.user.id) | Q(is_public=True))
-            )
-        elif property == 'type':
-            queryset = Brewery.objects.filter(
-                (Q(type__icontains=query)) &
-                (Q(user_id=request.user.id) | Q(is_public=True))
-            )
-        elif property == 'location':
-            queryset = Brewery.objects.filter(
-                (Q(location__icontains=query)) &
-                (Q(user_id=request.user.id) | Q(is_public=True))
-            )
-        elif property == 'description':
-            queryset = Brewery.objects.filter(
-                (Q(description__icontains=query)) &
-                (Q(user_id=request.user.id) | Q(is_public=True))
-            )
-        elif property == 'activity_types':
-            queryset = Brewery.objects.filter(
-                (Q(activity_types__icontains=query)) &
-                (Q(user_id=request.user.id) | Q(is_public=True))
-            )
-        else:
-            queryset = Brewery.objects.filter(
-            (Q(name__icontains=query) | Q(description__icontains=query) | Q(location__icontains=query) | Q(activity_types__icontains=query)) &
-            (Q(user_id=request.user.id) | Q(is_public=True))
+        # Results are ranked by relevance unless an explicit ordering is requested
+        if 'order_by' in request.query_params:
+            queryset = self.apply_sorting(queryset)
+        elif request.query_params.get('include_collections') == 'false':
+            queryset = queryset.filter(collection=None)
+
+        return self.paginate_and_respond(
+            queryset.for_serialization(), request, pagination.OptionalResultsSetPagination
         )
-        
-        queryset = self.apply_sorting(queryset)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Typo-tolerant suggestions for the search box, matched by trigram similarity on the
+        name and location of the user's own and public breweries. Results are cached per
+        user for a short time because the search box calls this on every keystroke.
+        """
+        query = request.query_params.get('query', '').strip()
+        if len(query) < 2:
+            return Response({"error": "Query must be at least 2 characters long"}, status=400)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), AUTOCOMPLETE_MAX_RESULTS)
+        except ValueError:
+            return Response({"error": "Limit must be a number"}, status=400)
+
+        query_hash = hashlib.md5(query.lower().encode()).hexdigest()
+        cache_key = 'brewery-autocomplete:{}:{}:{}:{}:{}'.format(
+            request.user.id, limit, query_hash, get_data_version(request.user.id), get_data_version(PUBLIC)
+        )
+        suggestions = cache.get(cache_key)
+        if suggestions is None:
+            suggestions = [
+                {
+                    'id': suggestion['id'],
+                    'name': suggestion['name'],
+                    'location': suggestion['location'],
+                    'similarity': round(suggestion['similarity'], 3),
+                }
+                for suggestion in Brewery.objects.filter(
+                    Q(user_id=request.user.id) | Q(is_public=True)
+                ).autocomplete(query, limit)
+            ]
+            cache.set(cache_key, suggestions, AUTOCOMPLETE_CACHE_TIMEOUT)
+        return Response(suggestions)
     
     def update(self, request, *args, **kwargs):
         # Retrieve the current object
@@ -281,7 +387,9 @@ class BreweryViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     def perform_update(self, serializer):
-        serializer.save()
+        brewery = serializer.save()
+        # Reload the brewery so annotations computed when it was fetched (is_visited) reflect the saved visits
+        serializer.instance = self.get_queryset().get(pk=brewery.pk)
     
     # when creating an brewery, make sure the user is the owner of the collection or shared with the collection
     @transaction.atomic
@@ -293,7 +401,7 @@ class BreweryViewSet(viewsets.ModelViewSet):
         if collection:
             user = self.request.user
             # Check if the user is the owner or is in the shared_with list
-            if collection.user_id != user and not collection.shared_with.filter(id=user.id).exists():
+            if collection.user_id_id != user.id and not membership.is_shared_with(self.request, collection.id):
                 # Return an error response if the user does not have permission
                 raise PermissionDenied("You do not have permission to use this collection.")
             # if collection the owner of the brewery is the owner of the collection
@@ -303,12 +411,3 @@ class BreweryViewSet(viewsets.ModelViewSet):
 
         # Save the brewery with the current user as the owner
         serializer.save(user_id=self.request.user)
-
-    def paginate_and_respond(self, queryset, request):
-        paginator = self.pagination_class()
-        page = paginator.paginate_queryset(queryset, request)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return paginator.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
\ No newline at end of file
@@ -4,6 +4,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from breweries.models import Category, Brewery
 from breweries.serializers import CategorySerializer
+from breweries.utils.cache import cache_response
 
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
@@ -14,6 +15,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return Category.objects.filter(user_id=self.request.user)
 
     @action(detail=False, methods=['get'])
+    @cache_response()
     def categories(self, request):
         """
         Retrieve a list of distinct categories for breweries associated with the current user.
@@ -6,12 +6,14 @@ from breweries.models import Checklist
 from breweries.serializers import ChecklistSerializer
 from rest_framework.exceptions import PermissionDenied
 from breweries.permissions import IsOwnerOrSharedWithFullAccess
+from breweries.utils import membership, pagination, visibility
 
-class ChecklistViewSet(viewsets.ModelViewSet):
+class ChecklistViewSet(pagination.PaginatedResponseMixin, viewsets.ModelViewSet):
     queryset = Checklist.objects.all()
     serializer_class = ChecklistSerializer
     permission_classes = [IsOwnerOrSharedWithFullAccess]
     filterset_fields = ['is_public', 'collection']
+    pagination_class = pagination.OptionalResultsSetPagination
 
     # return error message if user is not authenticated on the root endpoint
     def list(self, request, *args, **kwargs):
@@ -25,29 +27,21 @@ class ChecklistViewSet(viewsets.ModelViewSet):
             return Response({"error": "User is not authenticated"}, status=400)
         queryset = Checklist.objects.filter(
             Q(user_id=request.user.id)
-        )
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        ).for_serialization().order_by('-updated_at')
+        return self.paginate_and_respond(queryset, request)
     
 
     def get_queryset(self):
         # if the user is not authenticated return only public transportations for  retrieve action
         if not self.request.user.is_authenticated:
             if self.action == 'retrieve':
-                return Checklist.objects.filter(is_public=True).distinct().order_by('-updated_at')
+                return Checklist.objects.filter(is_public=True).order_by('-updated_at')
             return Checklist.objects.none()
 
-        
-        if self.action == 'retrieve':
-            # For individual brewery retrieval, include public breweries
-            return Checklist.objects.filter(
-                Q(is_public=True) | Q(user_id=self.request.user.id) | Q(collection__shared_with=self.request.user)
-            ).distinct().order_by('-updated_at')
-        else:
-            # For other actions, include user's own breweries and shared breweries
-            return Checklist.objects.filter(
-                Q(user_id=self.request.user.id) | Q(collection__shared_with=self.request.user)
-            ).distinct().order_by('-updated_at')
+        # For individual retrieval include public ones, for other actions the user's own and shared ones
+        return visibility.visible_to(
+            Checklist.objects.all(), self.request, include_public=self.action == 'retrieve'
+        ).order_by('-updated_at')
 
     def partial_update(self, request, *args, **kwargs):
         # Retrieve the current object
@@ -119,7 +113,7 @@ class ChecklistViewSet(viewsets.ModelViewSet):
         if collection:
             user = self.request.user
             # Check if the user is the owner or is in the shared_with list
-            if collection.user_id != user and not collection.shared_with.filter(id=user.id).exists():
+            if collection.user_id_id != user.id and not membership.is_shared_with(self.request, collection.id):
                 # Return an error response if the user does not have permission
                 raise PermissionDenied("You do not have permission to use this collection.")
             # if collection the owner of the brewery is the owner of the collection
@@ -127,4 +121,4 @@ class ChecklistViewSet(viewsets.ModelViewSet):
             return
 
         # Save the brewery with the current user as the owner
-        serializer.save(user_id=self.request.user)
\ No newline at end of file
+        serializer.save(user_id=self.request.user)
@@ -1,20 +1,43 @@
 from django.db.models import Q
 from django.db.models.functions import Lower
 from django.db import transaction
-from rest_framework import viewsets
+from django.utils import timezone
+from rest_framework import generics, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from breweries.models import Collection, Brewery, Transportation, Note
+from breweries.models import (
+    ITINERARY_CHECKLIST, ITINERARY_NOTE, ITINERARY_TRANSPORTATION, ITINERARY_VISIT,
+    Checklist, Collection, Brewery, Transportation, Note, Visit,
+)
 from breweries.permissions import CollectionShared
-from breweries.serializers import CollectionSerializer
+from breweries.serializers import BrewerySerializer, ChecklistSerializer, CollectionSerializer, CollectionSummarySerializer, NoteSerializer, TransportationSerializer, VisitSerializer
 from users.models import CustomUser as User
-from breweries.utils import pagination
+from breweries.utils import conditional, pagination, streaming, visibility
+from breweries.utils.cache import PUBLIC, cache_response, invalidate
 
-class CollectionViewSet(viewsets.ModelViewSet):
+# List actions that return collection cards with ?summary=true
+SUMMARY_ACTIONS = ['list', 'all', 'archived', 'shared']
+# Detail actions that page through the contents of a collection
+SUB_RESOURCE_ACTIONS = ['breweries', 'transportations', 'notes', 'checklists', 'itinerary']
+
+class CollectionViewSet(pagination.PaginatedResponseMixin, viewsets.ModelViewSet):
     serializer_class = CollectionSerializer
     permission_classes = [CollectionShared]
     pagination_class = pagination.StandardResultsSetPagination
 
+    def wants_summary(self):
+        return self.action in SUMMARY_ACTIONS and self.request.query_params.get('summary') == 'true'
+
+    def get_serializer_class(self):
+        if self.wants_summary():
+            return CollectionSummarySerializer
+        return super().get_serializer_class()
+
+    def with_serialization_plan(self, queryset):
+        if self.wants_summary():
+            return queryset.for_summary()
+        return queryset.for_serialization()
+
     # def get_queryset(self):
     #     return Collection.objects.filter(Q(user_id=self.request.user.id) & Q(is_archived=False))
 
@@ -45,11 +68,12 @@ class CollectionViewSet(viewsets.ModelViewSet):
 
         return queryset.order_by(ordering)
     
+    @cache_response()
     def list(self, request, *args, **kwargs):
         # make sure the user is authenticated
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
-        queryset = Collection.objects.filter(user_id=request.user.id)
+        queryset = self.with_serialization_plan(Collection.objects.filter(user_id=request.user.id))
         queryset = self.apply_sorting(queryset)
         collections = self.paginate_and_respond(queryset, request)
         return collections
@@ -59,29 +83,39 @@ class CollectionViewSet(viewsets.ModelViewSet):
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
        
-        queryset = Collection.objects.filter(
+        queryset = self.with_serialization_plan(Collection.objects.filter(
             Q(user_id=request.user.id)
-        )
+        ))
         
         queryset = self.apply_sorting(queryset)
-        serializer = self.get_serializer(queryset, many=True)
-       
-        return Response(serializer.data)
+        return self.paginate_and_respond(queryset, request, pagination.OptionalResultsSetPagination)
     
     @action(detail=False, methods=['get'])
+    @cache_response()
     def archived(self, request):
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
        
-        queryset = Collection.objects.filter(
+        queryset = self.with_serialization_plan(Collection.objects.filter(
             Q(user_id=request.user.id) & Q(is_archived=True)
-        )
+        ))
         
         queryset = self.apply_sorting(queryset)
         serializer = self.get_serializer(queryset, many=True)
        
         return Response(serializer.data)
     
+    def retrieve(self, request, *args, **kwargs):
+        # Answer conditional requests from the validators, before loading and serializing the collection
+        values = generics.get_object_or_404(
+            self.get_queryset().prefetch_related(None).order_by().validators(), pk=kwargs['pk']
+        )
+        etag, last_modified = conditional.validators_for(values)
+        if conditional.is_not_modified(request, etag, last_modified):
+            return conditional.not_modified(etag, last_modified)
+        response = super().retrieve(request, *args, **kwargs)
+        return conditional.set_validators(response, etag, last_modified)
+
     # this make the is_public field of the collection cascade to the breweries
     @transaction.atomic
     def update(self, request, *args, **kwargs):
@@ -106,13 +140,18 @@ class CollectionViewSet(viewsets.ModelViewSet):
                 return Response({"error": "User does not own the collection"}, status=400)
 
             # Update associated breweries to match the collection's is_public status
-            Brewery.objects.filter(collection=instance).update(is_public=new_public_status)
+            # queryset updates skip auto_now, so updated_at is set explicitly for conditional requests
+            # and send no signals, so public caches are invalidated here when a brewery changes visibility
+            now = timezone.now()
+            if Brewery.objects.filter(collection=instance).exclude(is_public=new_public_status).exists():
+                invalidate(PUBLIC)
+            Brewery.objects.filter(collection=instance).update(is_public=new_public_status, updated_at=now)
 
             # do the same for transportations
-            Transportation.objects.filter(collection=instance).update(is_public=new_public_status)
+            Transportation.objects.filter(collection=instance).update(is_public=new_public_status, updated_at=now)
 
             # do the same for notes
-            Note.objects.filter(collection=instance).update(is_public=new_public_status)
+            Note.objects.filter(collection=instance).update(is_public=new_public_status, updated_at=now)
 
             # Log the action (optional)
             action = "public" if new_public_status else "private"
@@ -129,16 +168,84 @@ class CollectionViewSet(viewsets.ModelViewSet):
     
     # make an action to retreive all breweries that are shared with the user
     @action(detail=False, methods=['get'])
+    @cache_response()
     def shared(self, request):
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
-        queryset = Collection.objects.filter(
+        queryset = self.with_serialization_plan(Collection.objects.filter(
             shared_with=request.user
-        )
+        ))
         queryset = self.apply_sorting(queryset)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
+    # The contents of a collection, page by page, for collection pages that should not load a whole trip
+    @action(detail=True, methods=['get'])
+    def breweries(self, request, pk=None):
+        return self.paginate_sub_resource(Brewery.objects.filter(collection=self.get_object()), BrewerySerializer)
+
+    @action(detail=True, methods=['get'])
+    def transportations(self, request, pk=None):
+        return self.paginate_sub_resource(Transportation.objects.filter(collection=self.get_object()), TransportationSerializer)
+
+    @action(detail=True, methods=['get'])
+    def notes(self, request, pk=None):
+        return self.paginate_sub_resource(Note.objects.filter(collection=self.get_object()), NoteSerializer)
+
+    @action(detail=True, methods=['get'])
+    def checklists(self, request, pk=None):
+        return self.paginate_sub_resource(Checklist.objects.filter(collection=self.get_object()), ChecklistSerializer)
+
+    def paginate_sub_resource(self, queryset, serializer_class):
+        queryset = queryset.for_serialization().order_by('-updated_at')
+        context = self.get_serializer_context()
+        if streaming.wants_stream(self.request):
+            return streaming.streaming_response(queryset, serializer_class, context)
+        paginator = pagination.get_paginator(self.request, self.pagination_class)
+        page = paginator.paginate_queryset(queryset, self.request)
+        serializer = serializer_class(page, many=True, context=context)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def itinerary(self, request, pk=None):
+        """
+        The collection as one timeline ordered by date: visits to its breweries, transportations,
+        notes and checklists. The order and the page come from a union in the database, then only
+        the objects on the page are loaded, so the first day of a large trip renders on its own.
+        """
+        collection = self.get_object()
+        # Page numbers only, a cursor cannot be expressed over the union
+        paginator = pagination.StandardResultsSetPagination()
+        rows = paginator.paginate_queryset(collection.itinerary(), request, view=self)
+        return paginator.get_paginated_response(self.serialize_itinerary(rows))
+
+    def serialize_itinerary(self, rows):
+        context = self.get_serializer_context()
+        ids = {ITINERARY_VISIT: [], ITINERARY_TRANSPORTATION: [], ITINERARY_NOTE: [], ITINERARY_CHECKLIST: []}
+        for kind, id, _, _, _ in rows:
+            ids[kind].append(id)
+        brewery_ids = {brewery_id for kind, _, _, _, brewery_id in rows if kind == ITINERARY_VISIT}
+
+        visits = Visit.objects.in_bulk(ids[ITINERARY_VISIT])
+        breweries = Brewery.objects.for_serialization().in_bulk(brewery_ids)
+        items = {
+            ITINERARY_TRANSPORTATION: (Transportation.objects.for_serialization().in_bulk(ids[ITINERARY_TRANSPORTATION]), TransportationSerializer),
+            ITINERARY_NOTE: (Note.objects.for_serialization().in_bulk(ids[ITINERARY_NOTE]), NoteSerializer),
+            ITINERARY_CHECKLIST: (Checklist.objects.for_serialization().in_bulk(ids[ITINERARY_CHECKLIST]), ChecklistSerializer),
+        }
+
+        entries = []
+        for kind, id, date, time, brewery_id in rows:
+            entry = {'type': kind, 'date': date, 'time': time}
+            if kind == ITINERARY_VISIT:
+                entry['visit'] = VisitSerializer(visits[id], context=context).data
+                entry['brewery'] = BrewerySerializer(breweries[brewery_id], context=context).data
+            else:
+                objects, serializer_class = items[kind]
+                entry[kind] = serializer_class(objects[id], context=context).data
+            entries.append(entry)
+        return entries
+
     # Adds a new user to the shared_with field of an brewery
     @action(detail=True, methods=['post'], url_path='share/(?P<uuid>[^/.]+)')
     def share(self, request, pk=None, uuid=None):
@@ -187,33 +294,27 @@ class CollectionViewSet(viewsets.ModelViewSet):
             return Collection.objects.filter(user_id=self.request.user.id)
         
         if self.action in ['update', 'partial_update']:
-            return Collection.objects.filter(
-                Q(user_id=self.request.user.id) | Q(shared_with=self.request.user)
-            ).distinct()
+            return visibility.visible_to(
+                Collection.objects.all(), self.request, collection_field='pk'
+            ).for_serialization()
         
+        if self.action in SUB_RESOURCE_ACTIONS:
+            # Only the collection itself, its contents are paginated separately
+            return visibility.visible_to(
+                Collection.objects.all(), self.request, include_public=True, collection_field='pk'
+            )
+
         if self.action == 'retrieve':
-            if not self.request.user.is_authenticated:
-                return Collection.objects.filter(is_public=True)
-            return Collection.objects.filter(
-                Q(is_public=True) | Q(user_id=self.request.user.id) | Q(shared_with=self.request.user)
-            ).distinct()
+            return visibility.visible_to(
+                Collection.objects.all(), self.request, include_public=True, collection_field='pk'
+            ).for_serialization()
         
         # For list action, include collections owned by the user or shared with the user, that are not archived
-        return Collection.objects.filter(
-            (Q(user_id=self.request.user.id) | Q(shared_with=self.request.user)) & Q(is_archived=False)
-        ).distinct()
+        return visibility.visible_to(
+            Collection.objects.filter(is_archived=False), self.request, collection_field='pk'
+        ).for_serialization()
 
 
     def perform_create(self, serializer):
         # This is ok because you cannot share a collection when creating it
         serializer.save(user_id=self.request.user)
-    
-    def paginate_and_respond(self, queryset, request):
-        paginator = self.pagination_class()
-        page = paginator.paginate_queryset(queryset, request)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return paginator.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
-    
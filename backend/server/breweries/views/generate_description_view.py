@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 import requests
+from main import outbound
 
 class GenerateDescription(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
@@ -14,9 +15,10 @@ class GenerateDescription(viewsets.ViewSet):
         name = name.replace('%20', ' ')
         print(name)
         url = 'https://en.wikipedia.org/w/api.php?origin=*&action=query&prop=extracts&exintro&explaintext&format=json&titles=%s' % name
-        response = requests.get(url)
-        data = response.json()
-        data = response.json()
+        try:
+            data = outbound.get(url).json()
+        except requests.exceptions.RequestException:
+            return Response({"error": "Failed to connect to Wikipedia"}, status=503)
         page_id = next(iter(data["query"]["pages"]))
         extract = data["query"]["pages"][page_id]
         if extract.get('extract') is None:
@@ -28,8 +30,10 @@ class GenerateDescription(viewsets.ViewSet):
         # un url encode the name
         name = name.replace('%20', ' ')
         url = 'https://en.wikipedia.org/w/api.php?origin=*&action=query&prop=pageimages&format=json&piprop=original&titles=%s' % name
-        response = requests.get(url)
-        data = response.json()
+        try:
+            data = outbound.get(url).json()
+        except requests.exceptions.RequestException:
+            return Response({"error": "Failed to connect to Wikipedia"}, status=503)
         page_id = next(iter(data["query"]["pages"]))
         extract = data["query"]["pages"][page_id]
         if extract.get('original') is None:
@@ -12,11 +12,10 @@ class IcsCalendarGeneratorViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def generate(self, request):
-        breweries = Brewery.objects.filter(user_id=request.user)
+        breweries = Brewery.objects.filter(user_id=request.user).for_serialization()
         serializer = BrewerySerializer(breweries, many=True)
         user = request.user
         name = f"{user.first_name} {user.last_name}"
-        print(serializer.data)
         
         cal = Calendar()
         cal.add('prodid', '-//My Brewery Calendar//example.com//')
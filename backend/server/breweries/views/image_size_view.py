@@ -0,0 +1,21 @@
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponseRedirect
+from rest_framework.permissions import AllowAny
+from rest_framework.views import APIView
+from breweries.utils import image_sizes
+from main.utils import media_url
+
+class ImageSizeView(APIView):
+    """
+    Generates a derived size of a media image on first use and redirects to it, so images stored
+    before derived sizes existed get them too. Later requests are served from the disk cache and
+    serializers link the generated file directly. Media is public, as it is when served by nginx.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, size, name):
+        if size not in image_sizes.IMAGE_SIZES or not image_sizes.is_source_name(name):
+            raise Http404
+        if not default_storage.exists(name):
+            raise Http404
+        return HttpResponseRedirect(media_url(image_sizes.generate(name, size)))
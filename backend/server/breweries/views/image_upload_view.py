@@ -0,0 +1,146 @@
+import os
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import BaseParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from breweries.models import ImageUpload
+from breweries.serializers import BreweryImageSerializer, ImageUploadSerializer
+from breweries.views.brewery_image_view import brewery_access_error, save_for_processing
+
+# Parts are copied from the request to the staging file in pieces of this size
+PART_CHUNK_SIZE = 64 * 1024
+UPLOAD_OFFSET_HEADER = 'Upload-Offset'
+
+class OffsetOctetStreamParser(BaseParser):
+    """
+    Accepts the raw bodies of upload parts. The view reads them from the request stream
+    itself, so nothing is parsed or buffered here.
+    """
+    media_type = 'application/offset+octet-stream'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return {}
+
+class StagedUpload(File):
+    """
+    The assembled staging file, handed to the image field the way Django hands over uploads it
+    spooled to disk: validated from its path and moved into storage rather than copied.
+    """
+    def temporary_file_path(self):
+        return self.file.name
+
+class ImageUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable image uploads for slow connections:
+
+    - POST with brewery, filename and size starts an upload at offset 0.
+    - PATCH with an Upload-Offset header and the next bytes as an
+      application/offset+octet-stream body appends a part. The offset must match the bytes
+      received so far; after a failed part, GET or HEAD returns the offset to resume from.
+    - POST finalize/ once every byte has arrived creates the BreweryImage like a single upload.
+    """
+    serializer_class = ImageUploadSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = viewsets.GenericViewSet.parser_classes + [OffsetOctetStreamParser]
+
+    def get_queryset(self):
+        return ImageUpload.objects.filter(user_id=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        error = brewery_access_error(request, serializer.validated_data['brewery'])
+        if error is not None:
+            return error
+        upload = serializer.save(user_id=request.user)
+        os.makedirs(os.path.dirname(upload.path), exist_ok=True)
+        open(upload.path, 'wb').close()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response[UPLOAD_OFFSET_HEADER] = response.data['offset']
+        return response
+
+    def partial_update(self, request, *args, **kwargs):
+        try:
+            offset = int(request.headers[UPLOAD_OFFSET_HEADER])
+        except (KeyError, ValueError):
+            return Response({"error": f"The {UPLOAD_OFFSET_HEADER} header is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The offset is claimed with a single conditional update, so no transaction or row lock is
+        # held while the part arrives over a possibly slow connection
+        now = timezone.now()
+        claimed = self.get_queryset().filter(pk=kwargs['pk'], received=offset).filter(
+            Q(receiving_since__isnull=True) | Q(receiving_since__lte=now - ImageUpload.PART_TIMEOUT)
+        ).update(receiving_since=now, updated_at=now)
+        upload = self.get_queryset().filter(pk=kwargs['pk']).first()
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        if not claimed:
+            return Response(
+                {"error": "Offset does not match the bytes received, or another part is being received", "offset": upload.received},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        try:
+            self.append_part(upload, request)
+        finally:
+            # Bytes that arrived before a failure count, the client resumes after them. Recorded in
+            # its own statement, which a failed part does not roll back
+            try:
+                upload.received = os.path.getsize(upload.path)
+            except FileNotFoundError:
+                # The upload was cancelled while the part arrived
+                pass
+            ImageUpload.objects.filter(pk=upload.pk).update(
+                received=upload.received, receiving_since=None, updated_at=timezone.now()
+            )
+        if upload.received > upload.size:
+            upload.delete()
+            return Response({"error": "Upload is larger than its declared size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = Response(self.get_serializer(upload).data)
+        response[UPLOAD_OFFSET_HEADER] = upload.received
+        return response
+
+    def append_part(self, upload, request):
+        remaining = upload.size - upload.received + 1
+        with open(upload.path, 'r+b') as staging:
+            # Drop whatever a failed part left after the recorded offset
+            staging.truncate(upload.received)
+            staging.seek(upload.received)
+            while remaining > 0:
+                chunk = request.stream.read(min(PART_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                staging.write(chunk)
+                remaining -= len(chunk)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        with transaction.atomic():
+            # A concurrent finalize of the same upload waits here and then finds it gone
+            upload = self.get_queryset().select_for_update().filter(pk=pk).first()
+            if upload is None:
+                return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+            if upload.received != upload.size or upload.is_receiving():
+                return Response(
+                    {"error": "Upload is not complete", "offset": upload.received},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            with open(upload.path, 'rb') as staging:
+                serializer = BreweryImageSerializer(
+                    data={'brewery': upload.brewery_id, 'image': StagedUpload(staging, name=upload.filename)},
+                    context=self.get_serializer_context(),
+                )
+                serializer.is_valid(raise_exception=True)
+                save_for_processing(serializer, user_id=request.user)
+            upload.delete()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
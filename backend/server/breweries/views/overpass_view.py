@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 import requests
+from main import outbound
 
 class OverpassViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
@@ -21,13 +22,13 @@ class OverpassViewSet(viewsets.ViewSet):
         """
         url = f"{self.BASE_URL}?data={query}"
         try:
-            response = requests.get(url, headers=self.HEADERS)
+            response = outbound.get(url, headers=self.HEADERS)
             response.raise_for_status()  # Raise an exception for HTTP errors
             return response.json()
-        except requests.exceptions.RequestException:
-            return Response({"error": "Failed to connect to Overpass API"}, status=500)
         except requests.exceptions.JSONDecodeError:
             return Response({"error": "Invalid response from Overpass API"}, status=400)
+        except requests.exceptions.RequestException:
+            return Response({"error": "Failed to connect to Overpass API"}, status=500)
         
     def parse_overpass_response(self, data, request):
         """
@@ -161,6 +162,8 @@ class OverpassViewSet(viewsets.ViewSet):
             )
 
         data = self.make_overpass_query(query)
+        if isinstance(data, Response):
+            return data
         breweries = self.parse_overpass_response(data, request)
         return Response(breweries)
 
@@ -178,6 +181,8 @@ class OverpassViewSet(viewsets.ViewSet):
         # Construct Overpass API query
         query = f'[out:json];node["name"~"{name}",i];out;'
         data = self.make_overpass_query(query)
+        if isinstance(data, Response):
+            return data
 
         breweries = self.parse_overpass_response(data, request)
         return Response(breweries)
@@ -4,7 +4,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from worldtravel.models import Region, City, VisitedRegion, VisitedCity
 from breweries.models import Brewery
-from breweries.serializers import BrewerySerializer
+from main import outbound
 import requests
 
 class ReverseGeocodeViewSet(viewsets.ViewSet):
@@ -67,51 +67,51 @@ class ReverseGeocodeViewSet(viewsets.ViewSet):
         lon = request.query_params.get('lon', '')
         url = f"https://nominatim.openstreetmap.org/reverse?format=jsonv2&lat={lat}&lon={lon}"
         headers = {'User-Agent': 'BreweryLog Server'}
-        response = requests.get(url, headers=headers)
         try:
-            data = response.json()
+            data = outbound.get(url, headers=headers).json()
         except requests.exceptions.JSONDecodeError:
             return Response({"error": "Invalid response from geocoding service"}, status=400)
+        except requests.exceptions.RequestException:
+            return Response({"error": "Failed to connect to geocoding service"}, status=503)
         return Response(self.extractIsoCode(data))
 
     @action(detail=False, methods=['post'])
     def mark_visited_region(self, request):
-        # searches through all of the users breweries, if the serialized data is_visited, is true, runs reverse geocode on the breweries and if a region is found, marks it as visited. Use the extractIsoCode function to get the region
+        # searches through all of the users visited breweries (is_visited is computed in the database), runs reverse geocode on the breweries and if a region is found, marks it as visited. Use the extractIsoCode function to get the region
         new_region_count = 0
         new_regions = {}
         new_city_count = 0
         new_cities = {}
-        breweries = Brewery.objects.filter(user_id=self.request.user)
-        serializer = BrewerySerializer(breweries, many=True)
-        for brewery, serialized_brewery in zip(breweries, serializer.data):
-            if serialized_brewery['is_visited'] == True:
-                lat = brewery.latitude
-                lon = brewery.longitude
-                if not lat or not lon:
-                    continue
-                url = f"https://nominatim.openstreetmap.org/reverse?format=jsonv2&lat={lat}&lon={lon}"
-                headers = {'User-Agent': 'BreweryLog Server'}
-                response = requests.get(url, headers=headers)
-                try:
-                    data = response.json()
-                except requests.exceptions.JSONDecodeError:
-                    return Response({"error": "Invalid response from geocoding service"}, status=400)
-                extracted_region = self.extractIsoCode(data)
-                if 'error' not in extracted_region:
-                    region = Region.objects.filter(id=extracted_region['region_id']).first()
-                    visited_region = VisitedRegion.objects.filter(region=region, user_id=self.request.user).first()
-                    if not visited_region:
-                        visited_region = VisitedRegion(region=region, user_id=self.request.user)
-                        visited_region.save()
-                        new_region_count += 1
-                        new_regions[region.id] = region.name
+        breweries = Brewery.objects.filter(user_id=self.request.user).with_is_visited().filter(is_visited=True)
+        for brewery in breweries:
+            lat = brewery.latitude
+            lon = brewery.longitude
+            if not lat or not lon:
+                continue
+            url = f"https://nominatim.openstreetmap.org/reverse?format=jsonv2&lat={lat}&lon={lon}"
+            headers = {'User-Agent': 'BreweryLog Server'}
+            try:
+                data = outbound.get(url, headers=headers).json()
+            except requests.exceptions.JSONDecodeError:
+                return Response({"error": "Invalid response from geocoding service"}, status=400)
+            except requests.exceptions.RequestException:
+                return Response({"error": "Failed to connect to geocoding service"}, status=503)
+            extracted_region = self.extractIsoCode(data)
+            if 'error' not in extracted_region:
+                region = Region.objects.filter(id=extracted_region['region_id']).first()
+                visited_region = VisitedRegion.objects.filter(region=region, user_id=self.request.user).first()
+                if not visited_region:
+                    visited_region = VisitedRegion(region=region, user_id=self.request.user)
+                    visited_region.save()
+                    new_region_count += 1
+                    new_regions[region.id] = region.name
 
-                    if extracted_region['city_id'] is not None:
-                        city = City.objects.filter(id=extracted_region['city_id']).first()
-                        visited_city = VisitedCity.objects.filter(city=city, user_id=self.request.user).first()
-                        if not visited_city:
-                            visited_city = VisitedCity(city=city, user_id=self.request.user)
-                            visited_city.save()
-                            new_city_count += 1
-                            new_cities[city.id] = city.name
+                if extracted_region['city_id'] is not None:
+                    city = City.objects.filter(id=extracted_region['city_id']).first()
+                    visited_city = VisitedCity.objects.filter(city=city, user_id=self.request.user).first()
+                    if not visited_city:
+                        visited_city = VisitedCity(city=city, user_id=self.request.user)
+                        visited_city.save()
+                        new_city_count += 1
+                        new_cities[city.id] = city.name
         return Response({"new_regions": new_region_count, "regions": new_regions, "new_cities": new_city_count, "cities": new_cities})
\ No newline at end of file
@@ -2,8 +2,9 @@ from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from worldtravel.models import City, Region, Country, VisitedCity, VisitedRegion
-from breweries.models import Brewery, Collection
+from worldtravel.models import GeodataStats
+from breweries.models import UserStats
+from breweries.utils.cache import cache_response
 
 class StatsViewSet(viewsets.ViewSet):
     """
@@ -12,27 +13,17 @@ class StatsViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     @action(detail=False, methods=['get'])
+    @cache_response()
     def counts(self, request):
-        brewery_count = Brewery.objects.filter(
-            user_id=request.user.id).count()
-        trips_count = Collection.objects.filter(
-            user_id=request.user.id).count()
-        visited_city_count = VisitedCity.objects.filter(
-            user_id=request.user.id).count()
-        total_cities = City.objects.count()
-        visited_region_count = VisitedRegion.objects.filter(
-            user_id=request.user.id).count()
-        total_regions = Region.objects.count()
-        visited_country_count = VisitedRegion.objects.filter(
-            user_id=request.user.id).values('region__country').distinct().count()
-        total_countries = Country.objects.count()
+        stats = UserStats.for_user(request.user.id)
+        geodata = GeodataStats.get()
         return Response({
-            'brewery_count': brewery_count,
-            'trips_count': trips_count,
-            'visited_city_count': visited_city_count,
-            'total_cities': total_cities,
-            'visited_region_count': visited_region_count,
-            'total_regions': total_regions,
-            'visited_country_count': visited_country_count,
-            'total_countries': total_countries
-        })
\ No newline at end of file
+            'brewery_count': stats.brewery_count,
+            'trips_count': stats.trips_count,
+            'visited_city_count': stats.visited_city_count,
+            'total_cities': geodata.city_count,
+            'visited_region_count': stats.visited_region_count,
+            'total_regions': geodata.region_count,
+            'visited_country_count': stats.visited_country_count,
+            'total_countries': geodata.country_count
+        })
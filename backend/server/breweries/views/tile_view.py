@@ -0,0 +1,120 @@
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from breweries.models import Brewery, Category, Visit
+from breweries.utils import conditional
+from breweries.utils.cache import PUBLIC, get_data_version
+from worldtravel.models import Region, VisitedRegion
+
+MAX_ZOOM = 22
+# Tiles are invalidated through the data versions in their keys, the timeout only evicts unused ones
+TILE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+MVT_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+# Each layer is one ST_AsMVT over the features intersecting the tile. Brewery points are
+# looked up through their GiST index with the tile envelope transformed back to WGS 84.
+BREWERIES_LAYER = f'''
+    SELECT ST_AsMVT(features.*, 'breweries', 4096, 'geom') FROM (
+        SELECT
+            ST_AsMVTGeom(ST_Transform(brewery.point, 3857), bounds.envelope) AS geom,
+            brewery.id::text AS id,
+            brewery.name,
+            category.name AS category,
+            category.icon,
+            EXISTS (
+                SELECT 1 FROM {Visit._meta.db_table} visit
+                WHERE visit.brewery_id = brewery.id AND visit.start_date <= %(today)s
+            ) AS is_visited
+        FROM {Brewery._meta.db_table} brewery
+        CROSS JOIN bounds
+        LEFT JOIN {Category._meta.db_table} category ON category.id = brewery.category_id
+        WHERE brewery.user_id_id = %(user_id)s AND brewery.point && bounds.envelope_4326
+    ) features
+'''
+
+PUBLIC_BREWERIES_LAYER = f'''
+    SELECT ST_AsMVT(features.*, 'public_breweries', 4096, 'geom') FROM (
+        SELECT
+            ST_AsMVTGeom(ST_Transform(brewery.point, 3857), bounds.envelope) AS geom,
+            brewery.id::text AS id,
+            brewery.name,
+            category.icon
+        FROM {Brewery._meta.db_table} brewery
+        CROSS JOIN bounds
+        LEFT JOIN {Category._meta.db_table} category ON category.id = brewery.category_id
+        WHERE brewery.is_public AND brewery.user_id_id <> %(user_id)s AND brewery.point && bounds.envelope_4326
+    ) features
+'''
+
+# Regions only have a center coordinate, so visited regions are drawn as points
+VISITED_REGIONS_LAYER = f'''
+    SELECT ST_AsMVT(features.*, 'visited_regions', 4096, 'geom') FROM (
+        SELECT
+            ST_AsMVTGeom(ST_Transform(visited_region.point, 3857), bounds.envelope) AS geom,
+            visited_region.id,
+            visited_region.name
+        FROM (
+            SELECT region.id, region.name,
+                ST_SetSRID(ST_MakePoint(region.longitude, region.latitude), 4326) AS point
+            FROM {VisitedRegion._meta.db_table} visited
+            JOIN {Region._meta.db_table} region ON region.id = visited.region_id
+            WHERE visited.user_id_id = %(user_id)s AND region.longitude IS NOT NULL AND region.latitude IS NOT NULL
+        ) visited_region
+        CROSS JOIN bounds
+        WHERE visited_region.point && bounds.envelope_4326
+    ) features
+'''
+
+
+class TileView(APIView):
+    """
+    Mapbox Vector Tiles of the user's breweries and visited regions, with ?public=true adding
+    a layer of other users' public breweries. Tiles are cached per user, tile, data version and
+    day, since is_visited flips as planned visits start.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, z, x, y):
+        if z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            return Response({"error": "Tile coordinates are out of range"}, status=400)
+        include_public = request.query_params.get('public', 'false') == 'true'
+
+        versions = [get_data_version(request.user.id)]
+        if include_public:
+            versions.append(get_data_version(PUBLIC))
+        today = timezone.now().date()
+        cache_key = f'tile:{request.user.id}:{z}/{x}/{y}:{int(include_public)}:{":".join(versions)}:{today.isoformat()}'
+
+        etag = conditional.make_etag(cache_key)
+        if conditional.etag_matches(request, etag):
+            return conditional.not_modified(etag)
+
+        tile = cache.get(cache_key)
+        if tile is None:
+            tile = self.render_tile(request.user, z, x, y, include_public, today)
+            cache.set(cache_key, tile, TILE_CACHE_TIMEOUT)
+        return conditional.set_validators(HttpResponse(tile, content_type=MVT_CONTENT_TYPE), etag)
+
+    def render_tile(self, user, z, x, y, include_public, today):
+        layers = [BREWERIES_LAYER, VISITED_REGIONS_LAYER]
+        if include_public:
+            layers.append(PUBLIC_BREWERIES_LAYER)
+        # An MVT tile is the concatenation of its layers
+        sql = '''
+            WITH bounds AS (
+                SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS envelope,
+                    ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s), 4326) AS envelope_4326
+            )
+            SELECT {}
+        '''.format(' || '.join(f"COALESCE(({layer}), ''::bytea)" for layer in layers))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'z': z, 'x': x, 'y': y,
+                'user_id': user.id,
+                'today': today,
+            })
+            return bytes(cursor.fetchone()[0])
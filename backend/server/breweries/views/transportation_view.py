@@ -7,32 +7,27 @@ from breweries.serializers import TransportationSerializer
 from rest_framework.exceptions import PermissionDenied
 from breweries.permissions import IsOwnerOrSharedWithFullAccess
 from rest_framework.permissions import IsAuthenticated
+from breweries.utils import membership, pagination, visibility
 
-class TransportationViewSet(viewsets.ModelViewSet):
+class TransportationViewSet(pagination.PaginatedResponseMixin, viewsets.ModelViewSet):
     queryset = Transportation.objects.all()
     serializer_class = TransportationSerializer
     permission_classes = [IsOwnerOrSharedWithFullAccess]
+    pagination_class = pagination.OptionalResultsSetPagination
 
     def list(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return Response(status=status.HTTP_403_FORBIDDEN)
         queryset = Transportation.objects.filter(
             Q(user_id=request.user.id)
-        )
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        ).for_serialization().order_by('-updated_at')
+        return self.paginate_and_respond(queryset, request)
 
     def get_queryset(self):
-        user = self.request.user
-        if self.action == 'retrieve':
-            # For individual brewery retrieval, include public breweries, user's own breweries and shared breweries
-            return Transportation.objects.filter(
-                Q(is_public=True) | Q(user_id=user.id) | Q(collection__shared_with=user.id)
-            ).distinct().order_by('-updated_at')
-        # For other actions, include user's own breweries and shared breweries
-        return Transportation.objects.filter(
-            Q(user_id=user.id) | Q(collection__shared_with=user.id)
-        ).distinct().order_by('-updated_at')
+        # For individual retrieval include public transportations, for other actions the user's own and shared ones
+        return visibility.visible_to(
+            Transportation.objects.all(), self.request, include_public=self.action == 'retrieve'
+        ).order_by('-updated_at')
 
     def partial_update(self, request, *args, **kwargs):
         # Retrieve the current object
@@ -73,7 +68,7 @@ class TransportationViewSet(viewsets.ModelViewSet):
         if collection:
             user = self.request.user
             # Check if the user is the owner or is in the shared_with list
-            if collection.user_id != user and not collection.shared_with.filter(id=user.id).exists():
+            if collection.user_id_id != user.id and not membership.is_shared_with(self.request, collection.id):
                 # Return an error response if the user does not have permission
                 raise PermissionDenied("You do not have permission to use this collection.")
             # if collection the owner of the brewery is the owner of the collection
@@ -81,4 +76,4 @@ class TransportationViewSet(viewsets.ModelViewSet):
             return
 
         # Save the brewery with the current user as the owner
-        serializer.save(user_id=self.request.user)
\ No newline at end of file
+        serializer.save(user_id=self.request.user)
@@ -1,3 +1,113 @@
-from django.test import TestCase
+import os
+import tempfile
+import types
+from unittest import mock
+import requests
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APITestCase
+from main import outbound
+from users.models import CustomUser
+from . import thumbnail_cache
+from .models import ImmichIntegration
 
-# Create your tests here.
+class ThumbnailCacheRootMixin:
+    """
+    Points the thumbnail cache at a temporary directory for each test.
+    """
+    cache_settings = {}
+
+    def setUp(self):
+        super().setUp()
+        cache_root = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_root.cleanup)
+        overridden = override_settings(IMMICH_THUMBNAIL_CACHE_ROOT=cache_root.name, **self.cache_settings)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        # The running total of the cache is module state
+        thumbnail_cache._total = None
+        self.addCleanup(setattr, thumbnail_cache, '_total', None)
+
+class ImmichThumbnailTests(ThumbnailCacheRootMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(username='testuser', email='testuser@example.com', password='testpassword')
+        self.client.force_login(self.user)
+
+    def test_repeat_views_are_cached(self):
+        integration = ImmichIntegration.objects.create(user=self.user, server_url='http://immich.local/api', api_key='key')
+        thumbnail = requests.Response()
+        thumbnail.status_code = 200
+        thumbnail._content = b'thumbnail'
+
+        with mock.patch.object(outbound, 'get', return_value=thumbnail) as fetch:
+            response = self.client.get('/api/integrations/immich/get/asset-1/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), b'thumbnail')
+            etag = response['ETag']
+
+            # Repeat views are answered from the cache without contacting Immich
+            response = self.client.get('/api/integrations/immich/get/asset-1/')
+            self.assertEqual(b''.join(response.streaming_content), b'thumbnail')
+            self.assertEqual(response['Cache-Control'], thumbnail_cache.CACHE_CONTROL)
+            response = self.client.get('/api/integrations/immich/get/asset-1/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        self.assertEqual(fetch.call_count, 1)
+
+        self.client.delete(f'/api/integrations/immich/{integration.id}/')
+        self.assertIsNone(thumbnail_cache.get(integration, 'asset-1'))
+
+    def test_other_users_integration_is_not_used(self):
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='testpassword')
+        ImmichIntegration.objects.create(user=other, server_url='http://immich.local/api', api_key='key')
+        response = self.client.get('/api/integrations/immich/get/asset-1/')
+        self.assertEqual(response.status_code, 403)
+
+class ThumbnailEvictionTests(ThumbnailCacheRootMixin, SimpleTestCase):
+    cache_settings = {'IMMICH_THUMBNAIL_CACHE_MAX_BYTES': 1000, 'IMMICH_THUMBNAIL_CACHE_USER_BYTES': 1000}
+
+    def integration(self, user_id):
+        return types.SimpleNamespace(user_id=user_id, id=f'integration-{user_id}', server_url='http://immich.local/api')
+
+    def store(self, integration, asset_id, used_at=None):
+        path, _ = thumbnail_cache.store(integration, asset_id, b'x' * 400)
+        if used_at is not None:
+            os.utime(path, (used_at, os.stat(path).st_mtime))
+
+    def cached(self, integration):
+        return sorted(os.listdir(thumbnail_cache.integration_dir(integration)))
+
+    @override_settings(IMMICH_THUMBNAIL_CACHE_MAX_BYTES=10000)
+    def test_user_quota_evicts_least_recently_used(self):
+        integration = self.integration(1)
+        self.store(integration, 'first', used_at=2000)
+        self.store(integration, 'second', used_at=1000)
+        # Over the quota of 1000 bytes, the least recently used thumbnail goes until 90% is left
+        self.store(integration, 'third')
+        self.assertEqual(self.cached(integration), ['first.jpg', 'third.jpg'])
+
+    @override_settings(IMMICH_THUMBNAIL_CACHE_USER_BYTES=10000)
+    def test_total_size_evicts_across_users(self):
+        first, second = self.integration(1), self.integration(2)
+        self.store(first, 'old', used_at=1000)
+        self.store(second, 'recent', used_at=2000)
+        self.store(second, 'new')
+        self.assertEqual(self.cached(first), [])
+        self.assertEqual(self.cached(second), ['new.jpg', 'recent.jpg'])
+
+    def test_thumbnails_over_the_quota_are_not_cached(self):
+        integration = self.integration(1)
+        self.assertIsNone(thumbnail_cache.store(integration, 'huge', b'x' * 1001))
+        self.assertIsNone(thumbnail_cache.store(integration, '../escape', b'x'))
+
+    def test_evict_stops_at_low_water(self):
+        integration = self.integration(1)
+        directory = thumbnail_cache.integration_dir(integration)
+        os.makedirs(directory)
+        for used_at, name in enumerate(['a', 'b', 'c', 'd', 'e']):
+            path = os.path.join(directory, f'{name}.jpg')
+            with open(path, 'wb') as file:
+                file.write(b'x' * 100)
+            os.utime(path, (used_at, used_at))
+        self.assertEqual(thumbnail_cache.evict(directory, 400), 300)
+        self.assertEqual(sorted(os.listdir(directory)), ['c.jpg', 'd.jpg', 'e.jpg'])
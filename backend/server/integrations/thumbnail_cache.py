@@ -0,0 +1,157 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from main.media import media_etag
+
+# Thumbnails belong to one user's Immich library, so only their browser keeps them
+CACHE_CONTROL = 'private, max-age=604800'
+# Eviction removes the least recently used thumbnails until this share of a limit is used, so it
+# does not run again on the next store
+LOW_WATER = 0.9
+# How long a process trusts its running total of the whole cache before scanning it again. Other
+# processes store thumbnails too, so the total is only an estimate between scans
+RESCAN_AFTER = 300
+ASSET_ID = re.compile(r'^[\w-]+$')
+PARTIAL_SUFFIX = '.tmp'
+
+_lock = threading.Lock()
+_total = None
+_scanned_at = 0
+
+
+def integration_dir(integration):
+    """
+    Thumbnails are kept per user, for the integration and the server it points to, so changing the
+    server URL never serves thumbnails of another library.
+    """
+    server = hashlib.sha256(integration.server_url.encode()).hexdigest()[:12]
+    return os.path.join(settings.IMMICH_THUMBNAIL_CACHE_ROOT, str(integration.user_id), f'{integration.id}-{server}')
+
+
+def thumbnail_path(integration, asset_id):
+    if not ASSET_ID.match(asset_id):
+        return None
+    return os.path.join(integration_dir(integration), f'{asset_id}.jpg')
+
+
+def get(integration, asset_id):
+    """
+    The path and stat of a cached thumbnail, or None. A hit moves the thumbnail to the end of the
+    LRU order by setting its access time, leaving its modification time and so its ETag alone.
+    """
+    path = thumbnail_path(integration, asset_id)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+        os.utime(path, (time.time(), stat.st_mtime))
+    except FileNotFoundError:
+        return None
+    return path, stat
+
+
+def store(integration, asset_id, content):
+    """
+    Caches a thumbnail and evicts the least recently used ones over the user's quota and the
+    total size. Returns what get() returns, or None when the thumbnail cannot be cached.
+    """
+    path = thumbnail_path(integration, asset_id)
+    if path is None or len(content) > settings.IMMICH_THUMBNAIL_CACHE_USER_BYTES:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written next to its final path and renamed into place, so readers never see a partial file
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=PARTIAL_SUFFIX, delete=False) as partial:
+        partial.write(content)
+    os.replace(partial.name, path)
+
+    user_dir = os.path.join(settings.IMMICH_THUMBNAIL_CACHE_ROOT, str(integration.user_id))
+    evict(user_dir, settings.IMMICH_THUMBNAIL_CACHE_USER_BYTES, keep=path)
+    enforce_total(len(content), keep=path)
+    return get(integration, asset_id)
+
+
+def entries(directory):
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(PARTIAL_SUFFIX):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield stat.st_atime, stat.st_size, path
+
+
+def evict(directory, max_bytes, keep=None):
+    """
+    Removes the least recently used thumbnails under directory once they take more than
+    max_bytes. Returns the bytes left.
+    """
+    cached = sorted(entries(directory))
+    total = sum(size for _, size, _ in cached)
+    if total <= max_bytes:
+        return total
+    for _, size, path in cached:
+        if total <= max_bytes * LOW_WATER:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
+
+
+def enforce_total(added, keep=None):
+    global _total, _scanned_at
+    with _lock:
+        max_bytes = settings.IMMICH_THUMBNAIL_CACHE_MAX_BYTES
+        stale = time.monotonic() - _scanned_at > RESCAN_AFTER
+        if _total is None or stale or _total + added > max_bytes:
+            _total = evict(settings.IMMICH_THUMBNAIL_CACHE_ROOT, max_bytes, keep=keep)
+            _scanned_at = time.monotonic()
+        else:
+            _total += added
+
+
+def purge(integration):
+    """
+    Removes every cached thumbnail of an integration, whichever server it pointed to.
+    """
+    user_dir = os.path.join(settings.IMMICH_THUMBNAIL_CACHE_ROOT, str(integration.user_id))
+    if not os.path.isdir(user_dir):
+        return
+    for name in os.listdir(user_dir):
+        if name.startswith(f'{integration.id}-'):
+            shutil.rmtree(os.path.join(user_dir, name), ignore_errors=True)
+
+
+def thumbnail_response(request, path, stat):
+    """
+    Answers with a cached thumbnail, or 304 when the browser has it. Inside MEDIA_ROOT and with
+    MEDIA_ACCEL_REDIRECT, nginx sends the file like other media.
+    """
+    etag = media_etag(stat)
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        relative = os.path.relpath(path, settings.MEDIA_ROOT)
+        if settings.MEDIA_ACCEL_REDIRECT and not relative.startswith('..'):
+            response = HttpResponse(content_type='image/jpeg')
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + relative
+        else:
+            response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+        response['Last-Modified'] = http_date(stat.st_mtime)
+    response['ETag'] = etag
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
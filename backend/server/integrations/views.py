@@ -7,6 +7,8 @@ from .models import ImmichIntegration
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 import requests
+from main import outbound
+from integrations import thumbnail_cache
 from rest_framework.pagination import PageNumberPagination
 
 class IntegrationView(viewsets.ViewSet):
@@ -50,7 +52,7 @@ class ImmichIntegrationView(viewsets.ViewSet):
                 },
                 status=status.HTTP_403_FORBIDDEN
             )
-        return ImmichIntegration.objects.first()
+        return user_integrations.first()
 
     @action(detail=False, methods=['get'], url_path='search')
     def search(self, request):
@@ -76,7 +78,7 @@ class ImmichIntegrationView(viewsets.ViewSet):
         
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
-            immich_fetch = requests.post(f'{integration.server_url}/search/smart', headers={
+            immich_fetch = outbound.post(f'{integration.server_url}/search/smart', headers={
                 'x-api-key': integration.api_key
             },
             json = {
@@ -84,7 +86,7 @@ class ImmichIntegrationView(viewsets.ViewSet):
             }
             )
             res = immich_fetch.json()
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             return Response(
                 {
                     'message': 'The Immich server is currently down or unreachable.',
@@ -133,15 +135,32 @@ class ImmichIntegrationView(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Thumbnails are served from the disk cache once fetched, the album grid requests dozens at once
+        cached = thumbnail_cache.get(integration, imageid)
+        if cached is not None:
+            return thumbnail_cache.thumbnail_response(request, *cached)
+
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
-            immich_fetch = requests.get(f'{integration.server_url}/assets/{imageid}/thumbnail?size=preview', headers={
+            immich_fetch = outbound.get(f'{integration.server_url}/assets/{imageid}/thumbnail?size=preview', headers={
                 'x-api-key': integration.api_key
             })
+            if immich_fetch.status_code != 200:
+                return Response(
+                    {
+                        'message': 'The Immich server could not return the image.',
+                        'error': True,
+                        'code': 'immich.image_unavailable'
+                    },
+                    status=status.HTTP_502_BAD_GATEWAY
+                )
+            cached = thumbnail_cache.store(integration, imageid, immich_fetch.content)
+            if cached is not None:
+                return thumbnail_cache.thumbnail_response(request, *cached)
             # should return the image file
             from django.http import HttpResponse
             return HttpResponse(immich_fetch.content, content_type='image/jpeg', status=status.HTTP_200_OK)
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             return Response(
                 {
                     'message': 'The Immich server is currently down or unreachable.',
@@ -163,11 +182,11 @@ class ImmichIntegrationView(viewsets.ViewSet):
 
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
-            immich_fetch = requests.get(f'{integration.server_url}/albums', headers={
+            immich_fetch = outbound.get(f'{integration.server_url}/albums', headers={
                 'x-api-key': integration.api_key
             })
             res = immich_fetch.json()
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             return Response(
                 {
                     'message': 'The Immich server is currently down or unreachable.',
@@ -204,11 +223,11 @@ class ImmichIntegrationView(viewsets.ViewSet):
         
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
-            immich_fetch = requests.get(f'{integration.server_url}/albums/{albumid}', headers={
+            immich_fetch = outbound.get(f'{integration.server_url}/albums/{albumid}', headers={
                 'x-api-key': integration.api_key
             })
             res = immich_fetch.json()
-        except requests.exceptions.ConnectionError:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
             return Response(
                 {
                     'message': 'The Immich server is currently down or unreachable.',
@@ -284,6 +303,7 @@ class ImmichIntegrationViewSet(viewsets.ModelViewSet):
                 },
                 status=status.HTTP_404_NOT_FOUND
             )
+        thumbnail_cache.purge(integration)
         integration.delete()
         return Response(
             {
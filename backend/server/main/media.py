@@ -0,0 +1,110 @@
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+# Media names that never change content: content-addressed blobs and their derived sizes
+IMMUTABLE_MEDIA = re.compile(r'^(blobs|derived/[a-z]+/blobs)/')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Other media keeps its name too, but may be replaced, so it is revalidated after a day
+MEDIA_CACHE_CONTROL = 'public, max-age=86400'
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def media_path(name):
+    """
+    The file of a media name, or None for names outside MEDIA_ROOT, hidden files and
+    directories.
+    """
+    root = os.path.realpath(settings.MEDIA_ROOT)
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep) or any(part.startswith('.') for part in name.split('/')):
+        return None
+    if not os.path.isfile(path):
+        return None
+    return path
+
+
+def media_etag(stat):
+    # The strong ETag nginx gives static files, so validators stay the same whichever sends the file
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    The (start, end) of a single byte range request, None when the header should be ignored and
+    False when the range cannot be satisfied. Multiple ranges are answered with the whole file.
+    """
+    match = RANGE_HEADER.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    else:
+        # bytes=-N is the last N bytes
+        start, end = max(size - int(end), 0), size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serves MEDIA_ROOT where Django is not behind the nginx of the Docker image, which sends
+    /media/ itself with the same validators and Cache-Control (see nginx.conf). Media is public
+    either way: no user is authorized, including for images of private breweries.
+    """
+    file_path = media_path(path)
+    if file_path is None:
+        raise Http404
+
+    stat = os.stat(file_path)
+    etag = media_etag(stat)
+    cache_control = IMMUTABLE_CACHE_CONTROL if IMMUTABLE_MEDIA.match(path) else MEDIA_CACHE_CONTROL
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+    content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    response = ranged_file_response(request, file_path, stat.st_size, content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def ranged_file_response(request, file_path, size, content_type):
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(file_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = StreamingHttpResponse(_read_range(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _read_range(file, length, chunk_size=64 * 1024):
+    with file:
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
@@ -0,0 +1,162 @@
+import logging
+import os
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a connection and between bytes of a response. Well below the 120 s gunicorn
+# timeout, so a slow upstream fails the request instead of holding the worker
+CONNECT_TIMEOUT = float(os.getenv('OUTBOUND_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.getenv('OUTBOUND_READ_TIMEOUT', 10))
+# Kept-alive connections per host
+POOL_SIZE = 10
+# Idempotent requests are retried on connection errors, read timeouts and gateway errors
+RETRY = Retry(
+    total=2, connect=2, read=1, status=2,
+    backoff_factor=0.3, backoff_max=2,
+    status_forcelist=(502, 503, 504),
+    respect_retry_after_header=False,
+    raise_on_status=False,
+)
+# After this many failed requests in a row a host is not contacted for CIRCUIT_COOLDOWN seconds,
+# then a single trial request decides whether it is back
+CIRCUIT_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 30
+USER_AGENT = 'BreweryLog Server'
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of contacting a host that keeps failing. A ConnectionError, so callers handle
+    it like the host being down, which it most likely is.
+    """
+
+
+class Host:
+    """
+    The connection pool, circuit breaker and metrics of one upstream host. State is per process,
+    like the pools themselves.
+    """
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        # Hosts are shared by every user of the server, so no cookies are kept between requests
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=RETRY)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_error = None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= CIRCUIT_COOLDOWN and not self.trial_running:
+                self.trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, seconds, retries, error=None):
+        with self.lock:
+            self.requests += 1
+            self.retries += retries
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.trial_running = False
+            if error is None:
+                self.consecutive_failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            if self.opened_at is not None or self.consecutive_failures >= CIRCUIT_THRESHOLD:
+                if self.opened_at is None:
+                    logger.warning('Circuit opened for %s after %s failures: %s', self.base_url, self.consecutive_failures, error)
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'failures': self.failures,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'average_ms': round(self.total_seconds / self.requests * 1000, 1) if self.requests else None,
+                'max_ms': round(self.max_seconds * 1000, 1),
+                'circuit': 'closed' if self.opened_at is None else 'open',
+                'last_error': self.last_error,
+            }
+
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def get_host(url):
+    parts = urlsplit(url)
+    base_url = f'{parts.scheme}://{parts.netloc}'.lower()
+    with _hosts_lock:
+        if base_url not in _hosts:
+            _hosts[base_url] = Host(base_url)
+        return _hosts[base_url]
+
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Sends a request through the pool of its host, with the default timeouts and retries. Raises
+    CircuitOpenError without sending it while the host is failing. 5xx responses are returned
+    like any other response, but count as failures of the host.
+    """
+    host = get_host(url)
+    if not host.allow():
+        raise CircuitOpenError(f'{host.base_url} is failing, not contacting it for up to {CIRCUIT_COOLDOWN} s')
+
+    start = time.monotonic()
+    try:
+        response = host.session.request(method, url, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+    except requests.exceptions.RequestException as e:
+        host.record(time.monotonic() - start, 0, error=type(e).__name__)
+        raise
+
+    retry = getattr(response.raw, 'retries', None)
+    retries = len(retry.history) if retry is not None else 0
+    error = f'HTTP {response.status_code}' if response.status_code >= 500 else None
+    host.record(time.monotonic() - start, retries, error=error)
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def metrics():
+    """
+    Request counts, latencies and circuit state by host, for this server process.
+    """
+    with _hosts_lock:
+        hosts = list(_hosts.values())
+    return {host.base_url: host.snapshot() for host in hosts}
@@ -10,6 +10,7 @@ https://docs.djangoproject.com/en/1.7/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+import tempfile
 from dotenv import load_dotenv
 from os import getenv
 from pathlib import Path
@@ -60,6 +61,7 @@ INSTALLED_APPS = (
     'users',
     'integrations',
     'django.contrib.gis',
+    'django.contrib.postgres',
     # 'widget_tweaks',
     # 'slippers',
 
@@ -83,9 +85,15 @@ ACCOUNT_EMAIL_VERIFICATION = 'none'
 
 ALLAUTH_UI_THEME = "night"
 
+# Shared by all gunicorn workers, so data versions bumped by one worker invalidate
+# cached responses in the others (a per-process memory cache could serve stale data)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': getenv('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'brewerylog-cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(getenv('CACHE_MAX_ENTRIES', 5000)),
+        },
     }
 }
 
@@ -158,6 +166,17 @@ STATIC_URL = '/static/'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Behind the nginx of the container, cached Immich thumbnails are sent by nginx after Django
+# answers with X-Accel-Redirect
+MEDIA_ACCEL_REDIRECT = getenv('MEDIA_ACCEL_REDIRECT', 'False') == 'True'
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Parts of chunked image uploads, on the media volume so uploads can resume after a restart.
+# The directory is hidden, which keeps it from being served
+UPLOAD_STAGING_ROOT = getenv('UPLOAD_STAGING_ROOT', str(MEDIA_ROOT / '.uploads'))
+# Thumbnails proxied from Immich, kept until the least recently used ones exceed either limit
+IMMICH_THUMBNAIL_CACHE_ROOT = getenv('IMMICH_THUMBNAIL_CACHE_ROOT', str(MEDIA_ROOT / '.immich-thumbnails'))
+IMMICH_THUMBNAIL_CACHE_MAX_BYTES = int(getenv('IMMICH_THUMBNAIL_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+IMMICH_THUMBNAIL_CACHE_USER_BYTES = int(getenv('IMMICH_THUMBNAIL_CACHE_USER_BYTES', 256 * 1024 * 1024))
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
 STORAGES = {
@@ -0,0 +1,72 @@
+import tempfile
+from unittest import mock
+import requests
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
+from users.models import CustomUser
+from breweries.views import OverpassViewSet
+from . import outbound
+
+class OutboundClientTests(APITestCase):
+
+    def setUp(self):
+        # Pools and circuits are module state, shared by every test in the process
+        outbound._hosts.clear()
+        self.addCleanup(outbound._hosts.clear)
+        self.user = CustomUser.objects.create_user(username='testuser', email='testuser@example.com', password='testpassword')
+        self.client.force_login(self.user)
+
+    def test_circuit_breaker(self):
+        failure = requests.exceptions.ConnectTimeout('Connection timed out')
+        with mock.patch.object(requests.adapters.HTTPAdapter, 'send', side_effect=failure) as send:
+            for _ in range(outbound.CIRCUIT_THRESHOLD):
+                response = self.client.get('/api/overpass/search/?name=Denver')
+                self.assertEqual(response.status_code, 500)
+            # The failing host is no longer contacted
+            response = self.client.get('/api/overpass/search/?name=Denver')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(send.call_count, outbound.CIRCUIT_THRESHOLD)
+
+        host = outbound.get_host(OverpassViewSet.BASE_URL)
+        self.assertEqual(host.snapshot()['circuit'], 'open')
+        self.assertEqual(host.snapshot()['rejected'], 1)
+
+    def test_metrics_are_for_staff(self):
+        self.assertEqual(self.client.get('/outbound-metrics/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        outbound.get_host(OverpassViewSet.BASE_URL)
+        response = self.client.get('/outbound-metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(OverpassViewSet.BASE_URL, response.json()['hosts'])
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overridden = override_settings(MEDIA_ROOT=media_root.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def test_media_serving(self):
+        name = default_storage.save('blobs/ab/test.txt', ContentFile(b'0123456789'))
+
+        response = self.client.get(f'/media/{name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('immutable', response['Cache-Control'])
+        etag = response['ETag']
+
+        response = self.client.get(f'/media/{name}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(f'/media/{name}', HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(self.client.get(f'/media/{name}', HTTP_RANGE='bytes=20-').status_code, 416)
+
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
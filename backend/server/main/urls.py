@@ -1,10 +1,9 @@
 from django.urls import include, re_path, path
 from django.contrib import admin
 from django.views.generic import RedirectView, TemplateView
-from django.conf import settings
-from django.conf.urls.static import static
 from users.views import IsRegistrationDisabled, PublicUserListView, PublicUserDetailView, UserMetadataView, UpdateUserMetadataView, EnabledSocialProvidersView
-from .views import get_csrf_token, get_public_url
+from .media import serve_media
+from .views import get_csrf_token, get_outbound_metrics, get_public_url
 from drf_yasg.views import get_schema_view
 
 from drf_yasg import openapi
@@ -31,6 +30,7 @@ urlpatterns = [
 
     path('csrf/', get_csrf_token, name='get_csrf_token'),
     path('public-url/', get_public_url, name='get_public_url'),
+    path('outbound-metrics/', get_outbound_metrics, name='get_outbound_metrics'),
     
     path('', TemplateView.as_view(template_name='home.html')),
     
@@ -46,4 +46,5 @@ urlpatterns = [
 
     # Include the API endpoints:
     
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(r'^media/(?P<path>.+)$', serve_media, name='media'),
+]
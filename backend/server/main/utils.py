@@ -1,10 +1,21 @@
+import os
 from rest_framework import serializers
 
 def get_user_uuid(user):
     return str(user.uuid)
 
+def public_base_url():
+    public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
+    # remove any  ' from the url
+    return public_url.replace("'", "")
+
+def media_url(name):
+    return f"{public_base_url()}/media/{name}"
+
 class CustomModelSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['user_id'] = get_user_uuid(instance.user_id)
+        # Serialization plans annotate the owner's uuid so the user row is not fetched per object
+        user_uuid = getattr(instance, 'user_uuid', None)
+        representation['user_id'] = str(user_uuid) if user_uuid else get_user_uuid(instance.user_id)
         return representation
\ No newline at end of file
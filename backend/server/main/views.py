@@ -1,10 +1,17 @@
 from django.http import JsonResponse
 from django.middleware.csrf import get_token
-from os import getenv
+from os import getenv, getpid
+from . import outbound
 
 def get_csrf_token(request):
     csrf_token = get_token(request)
     return JsonResponse({'csrfToken': csrf_token})
 
 def get_public_url(request):
-    return JsonResponse({'PUBLIC_URL': getenv('PUBLIC_URL')})
\ No newline at end of file
+    return JsonResponse({'PUBLIC_URL': getenv('PUBLIC_URL')})
+
+def get_outbound_metrics(request):
+    # Pools and circuits are per server process, so the numbers are for the one that answers
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return JsonResponse({'pid': getpid(), 'hosts': outbound.metrics()})
@@ -2,6 +2,8 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 
 from breweries.models import Collection
+from breweries.utils import image_processing, image_sizes
+from main.utils import media_url
 
 User = get_user_model()
 
@@ -32,7 +34,6 @@ from .models import CustomUser
 
 from rest_framework import serializers
 from django.conf import settings
-import os
 
 class UserDetailsSerializer(serializers.ModelSerializer):
     """
@@ -78,7 +79,10 @@ class UserDetailsSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         self.handle_public_profile_change(instance, validated_data)
-        return super().update(instance, validated_data)
+        instance = super().update(instance, validated_data)
+        if validated_data.get('profile_pic'):
+            image_processing.enqueue_sizes(instance.profile_pic.name)
+        return instance
 
     def partial_update(self, instance, validated_data):
         self.handle_public_profile_change(instance, validated_data)
@@ -111,10 +115,10 @@ class CustomUserDetailsSerializer(UserDetailsSerializer):
         representation = super().to_representation(instance)
 
         # Construct profile picture URL if it exists
+        representation['profile_pic_sizes'] = None
         if instance.profile_pic:
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            public_url = public_url.replace("'", "")  # Sanitize URL
-            representation['profile_pic'] = f"{public_url}/media/{instance.profile_pic.name}"
+            representation['profile_pic'] = media_url(instance.profile_pic.name)
+            representation['profile_pic_sizes'] = image_sizes.size_urls(instance.profile_pic.name)
 
         # Remove `pk` field from the response
         representation.pop('pk', None)
@@ -1,7 +1,7 @@
 import os
 from django.core.management.base import BaseCommand
-import requests
-from worldtravel.models import Country, Region, City
+from main import outbound
+from worldtravel.models import Country, Region, City, GeodataStats
 from django.db import transaction
 from tqdm import tqdm
 import ijson
@@ -27,7 +27,7 @@ def saveCountryFlag(country_code):
         print(f'Flag for {country_code} already exists')
         return
 
-    res = requests.get(f'https://flagcdn.com/h240/{country_code}.png'.lower())
+    res = outbound.get(f'https://flagcdn.com/h240/{country_code}.png'.lower())
     if res.status_code == 200:
         with open(flag_path, 'wb') as f:
             f.write(res.content)
@@ -46,7 +46,7 @@ class Command(BaseCommand):
         batch_size = 100
         countries_json_path = os.path.join(settings.MEDIA_ROOT, f'countries+regions+states-{COUNTRY_REGION_JSON_VERSION}.json')
         if not os.path.exists(countries_json_path) or force:
-            res = requests.get(f'https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/{COUNTRY_REGION_JSON_VERSION}/json/countries%2Bstates%2Bcities.json')
+            res = outbound.get(f'https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/{COUNTRY_REGION_JSON_VERSION}/json/countries%2Bstates%2Bcities.json')
             if res.status_code == 200:
                 with open(countries_json_path, 'w') as f:
                     f.write(res.text)
@@ -226,4 +226,7 @@ class Command(BaseCommand):
             Region.objects.exclude(id__in=processed_region_ids).delete()
             City.objects.exclude(id__in=processed_city_ids).delete()
 
+        # Stored once here rather than counted by every stats request
+        GeodataStats.refresh()
+
         self.stdout.write(self.style.SUCCESS('All data imported successfully'))
\ No newline at end of file
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.contrib.gis.db import models as gis_models
 
@@ -80,4 +81,40 @@ class VisitedCity(models.Model):
         super().save(*args, **kwargs)
 
     class Meta:
-        verbose_name_plural = "Visited Cities"
\ No newline at end of file
+        verbose_name_plural = "Visited Cities"
+
+class GeodataStats(models.Model):
+    """
+    Totals of the imported countries, regions and cities, stored by download-countries so the
+    stats endpoint does not count the geodata tables on every call. There is a single row.
+    """
+    CACHE_KEY = 'geodata-stats'
+
+    country_count = models.IntegerField(default=0)
+    region_count = models.IntegerField(default=0)
+    city_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Geodata Stats"
+
+    @classmethod
+    def refresh(cls):
+        stats, created = cls.objects.update_or_create(pk=1, defaults={
+            'country_count': Country.objects.count(),
+            'region_count': Region.objects.count(),
+            'city_count': City.objects.count(),
+        })
+        cache.set(cls.CACHE_KEY, stats, None)
+        return stats
+
+    @classmethod
+    def get(cls):
+        stats = cache.get(cls.CACHE_KEY)
+        if stats is None:
+            stats = cls.objects.filter(pk=1).first()
+            if stats is None:
+                # Geodata imported before the totals were stored
+                return cls.refresh()
+            cache.set(cls.CACHE_KEY, stats, None)
+        return stats
@@ -25,6 +25,9 @@ export type Brewery = {
 		id: string;
 		image: string;
 		is_primary: boolean;
+		status?: string;
+		sizes?: { thumbnail: string; card: string; full: string } | null;
+		srcset?: string | null;
 	}[];
 	visits: {
 		id: string;